@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -27,13 +28,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Serve static files before sessions/auth/CSRF run
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Per-request query counting and N+1 warnings; only active with QUERY_COUNT_ENABLED
+    'core.querycount.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'college_management.urls'
@@ -59,17 +63,91 @@ WSGI_APPLICATION = 'college_management.wsgi.application'
 # Database
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': config("DB_ENGINE", default="django.db.backends.postgresql"),
         'NAME': config("DB_NAME"),
         'USER': config("DB_USER"),
         'PASSWORD': config("DB_PASSWORD"),
         'HOST': config("DB_HOST"),
         'PORT': config("DB_PORT", default="5432"),
+        # Keep connections open between requests (seconds, 0 closes after each request)
+        'CONN_MAX_AGE': config("DB_CONN_MAX_AGE", default=60, cast=int),
+        # Check a reused connection is still alive before the first query of a request
+        'CONN_HEALTH_CHECKS': config("DB_CONN_HEALTH_CHECKS", default=True, cast=bool),
     }
 }
 
+# Optional read replica for reporting endpoints (college recommendations, analytics, panel, admin
+# student lists). Unset DB_REPLICA_HOST (or DB_REPLICA_NAME for SQLite) to read everything from the primary.
+REPLICA_DATABASE = 'replica'
+if config("DB_REPLICA_HOST", default="") or config("DB_REPLICA_NAME", default=""):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': config("DB_REPLICA_NAME", default=DATABASES['default']['NAME']),
+        'USER': config("DB_REPLICA_USER", default=DATABASES['default']['USER']),
+        'PASSWORD': config("DB_REPLICA_PASSWORD", default=DATABASES['default']['PASSWORD']),
+        'HOST': config("DB_REPLICA_HOST", default=DATABASES['default']['HOST']),
+        'PORT': config("DB_REPLICA_PORT", default=DATABASES['default']['PORT']),
+        # Tests read the replica through the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.routers.ReportingReplicaRouter']
+# Seconds a student (and the submitting client) keep reading from the primary after submitting
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=10, cast=int)
+
 GEMINI_API_KEY = config("GEMINI_API_KEY")
 
+# LLM rate limiting, shared by all workers through the database (per-minute budgets, 0 = unlimited)
+LLM_GLOBAL_REQUESTS_PER_MINUTE = config("LLM_GLOBAL_REQUESTS_PER_MINUTE", default=60, cast=int)
+LLM_GLOBAL_TOKENS_PER_MINUTE = config("LLM_GLOBAL_TOKENS_PER_MINUTE", default=1000000, cast=int)
+LLM_COLLEGE_REQUESTS_PER_MINUTE = config("LLM_COLLEGE_REQUESTS_PER_MINUTE", default=30, cast=int)
+LLM_COLLEGE_TOKENS_PER_MINUTE = config("LLM_COLLEGE_TOKENS_PER_MINUTE", default=500000, cast=int)
+LLM_OUTPUT_TOKEN_ESTIMATE = config("LLM_OUTPUT_TOKEN_ESTIMATE", default=300, cast=int)
+# Seconds a call may wait in the queue before giving up, and how often waiters re-check
+LLM_MAX_QUEUE_WAIT = config("LLM_MAX_QUEUE_WAIT", default=90, cast=float)
+LLM_QUEUE_POLL_INTERVAL = config("LLM_QUEUE_POLL_INTERVAL", default=0.25, cast=float)
+# Pack several subject groups into one prompt, up to this many estimated tokens of course data per prompt
+LLM_BATCH_GROUPS = config("LLM_BATCH_GROUPS", default=False, cast=bool)
+LLM_BATCH_TOKEN_BUDGET = config("LLM_BATCH_TOKEN_BUDGET", default=6000, cast=int)
+# Retries when the provider itself throttles (HTTP 429), with exponential backoff in seconds
+LLM_MAX_RETRIES = config("LLM_MAX_RETRIES", default=3, cast=int)
+LLM_RETRY_BACKOFF = config("LLM_RETRY_BACKOFF", default=2, cast=float)
+# Seconds one submission may spend waiting for budget and retrying across all its LLM calls.
+# gunicorn.conf.py refuses to start unless it stays well below GUNICORN_TIMEOUT.
+LLM_SUBMISSION_TIMEOUT = config("LLM_SUBMISSION_TIMEOUT", default=90, cast=float)
+# Subject groups with more courses than this are shortlisted by embedding similarity before prompting (0 = off).
+# Off by default: enable it together with a semantic COURSE_EMBEDDER such as SentenceTransformerEmbedder.
+COURSE_SHORTLIST_SIZE = config("COURSE_SHORTLIST_SIZE", default=0, cast=int)
+# A group is only shortlisted when enough courses score above this cosine similarity to the answers
+COURSE_SHORTLIST_MIN_SCORE = config("COURSE_SHORTLIST_MIN_SCORE", default=0.1, cast=float)
+# Dotted path of the embedder class; core.embeddings.SentenceTransformerEmbedder needs sentence-transformers
+COURSE_EMBEDDER = config("COURSE_EMBEDDER", default="core.embeddings.HashingEmbedder")
+
+# Cache (use a shared backend such as DatabaseCache or Redis when running several workers)
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config("CACHE_LOCATION", default="college-management"),
+    }
+}
+# Replica pins live in the cache: a per-process cache would let a student's next read land on
+# another worker that never saw the pin, so a replica is only allowed with a shared cache.
+if REPLICA_DATABASE in DATABASES and CACHES['default']['BACKEND'].rsplit('.', 1)[-1] in ('LocMemCache', 'DummyCache'):
+    raise ImproperlyConfigured(
+        "A read replica needs a shared CACHE_BACKEND (e.g. DatabaseCache or Redis) so every worker sees replica pins."
+    )
+
+# Seconds a college's serialized questions stay cached; imports and admin edits bump the survey version instead
+QUESTION_CACHE_TIMEOUT = config("QUESTION_CACHE_TIMEOUT", default=300, cast=int)
+
+# Minimum seconds between two updates of an unchanged catalogue snapshot's checked_at
+CATALOGUE_CHECK_INTERVAL = config("CATALOGUE_CHECK_INTERVAL", default=300, cast=int)
+
+# Query counting middleware (off in production): warn when a request runs more than
+# QUERY_COUNT_BUDGET queries or repeats one query shape QUERY_COUNT_REPEAT_THRESHOLD times
+QUERY_COUNT_ENABLED = config("QUERY_COUNT_ENABLED", default=DEBUG, cast=bool)
+QUERY_COUNT_BUDGET = config("QUERY_COUNT_BUDGET", default=30, cast=int)
+QUERY_COUNT_REPEAT_THRESHOLD = config("QUERY_COUNT_REPEAT_THRESHOLD", default=5, cast=int)
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -98,6 +176,20 @@ STATIC_URL = 'static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# Compressed (gzip/brotli) files with content hashes in their names; requires collectstatic at build time
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Hashed files are cached "forever" by WhiteNoise; this applies to unhashed URLs, which must
+# stay short so a deploy reaches clients (60 s is WhiteNoise's own default)
+WHITENOISE_MAX_AGE = config("WHITENOISE_MAX_AGE", default=60, cast=int)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
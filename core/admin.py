@@ -1,7 +1,15 @@
+import json
+
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import College, Question, Option, Student, CollegeUser, RecommendationSetting
+from .models import College, Question, Option, Student, CollegeUser, RecommendationSetting, CatalogueSnapshot
+from .surveys import invalidate_question_cache
+from .precompute import invalidate_precomputed
+from .routers import reporting_view
 
 # --- Inlines for Richer Detail Views ---
 
@@ -29,26 +37,6 @@ class RecommendationSettingInline(admin.TabularInline):
     model = RecommendationSetting
     extra = 1
 
-class StudentInline(admin.TabularInline):
-    """
-    Displays a list of students associated with a college on its detail page.
-    Provides a quick overview of registered students without leaving the college view.
-    """
-    model = Student
-    extra = 0 # No extra forms needed, just for display
-    show_change_link = True
-    verbose_name_plural = 'Registered Students'
-    # Define which fields to show in the inline view
-    fields = ('student_id', 'name', 'department', 'semester')
-    readonly_fields = ('student_id', 'name', 'department', 'semester')
-
-    def has_add_permission(self, request, obj=None):
-        return False # Disable adding students from the college page
-
-    def has_delete_permission(self, request, obj=None):
-        return False # Disable deleting students from the college page
-
-
 # --- Main ModelAdmin Configurations ---
 
 @admin.register(College)
@@ -59,7 +47,25 @@ class CollegeAdmin(admin.ModelAdmin):
     """
     list_display = ('name', 'college_id', 'base_url')
     search_fields = ('name', 'college_id')
-    inlines = [QuestionInline, StudentInline, RecommendationSettingInline]
+    readonly_fields = ('registered_students',)
+    inlines = [QuestionInline, RecommendationSettingInline]
+
+    @admin.display(description='Registered Students')
+    def registered_students(self, obj):
+        """
+        Links to the paginated Student changelist filtered by this college.
+        Rendering every student inline makes the change page unusable for large colleges.
+        """
+        if obj.pk is None:
+            return '-'
+        url = reverse('admin:core_student_changelist') + f'?college__id__exact={obj.pk}'
+        count = obj.student_set.count()
+        return format_html('<a href="{}">View {} registered students</a>', url, count)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        invalidate_question_cache(form.instance)
+        invalidate_precomputed(form.instance)
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
@@ -69,9 +75,29 @@ class QuestionAdmin(admin.ModelAdmin):
     """
     list_display = ('text', 'college', 'question_id')
     list_filter = ('college',)
+    list_select_related = ('college',)
     search_fields = ('text', 'question_id', 'college__name')
+    autocomplete_fields = ('college',)
     inlines = [OptionInline]
 
+    # Refresh the cached question payload once per save, after the options inline is saved.
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        invalidate_question_cache(form.instance.college)
+        invalidate_precomputed(form.instance.college)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_question_cache(obj.college)
+        invalidate_precomputed(obj.college)
+
+    def delete_queryset(self, request, queryset):
+        colleges = {question.college for question in queryset.select_related('college')}
+        super().delete_queryset(request, queryset)
+        for college in colleges:
+            invalidate_question_cache(college)
+            invalidate_precomputed(college)
+
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     """
@@ -80,19 +106,43 @@ class StudentAdmin(admin.ModelAdmin):
     """
     list_display = ('student_id', 'name', 'college', 'department', 'semester', 'created_at')
     list_filter = ('college', 'department', 'semester')
+    list_select_related = ('college',)
+    list_per_page = 50
+    show_full_result_count = False  # Skip the extra unfiltered COUNT(*) on large tables
     search_fields = ('student_id', 'name', 'college__name')
-    readonly_fields = ('created_at', 'responses', 'recommendations')
+    autocomplete_fields = ('college',)
+    readonly_fields = ('created_at', 'responses', 'recommendation_list')
     # Organizes the detail view into sections
     fieldsets = (
         ('Student Information', {
             'fields': ('student_id', 'name', 'college', 'department', 'semester')
         }),
         ('Survey Data', {
-            'fields': ('responses', 'recommendations'),
+            'fields': ('responses', 'recommendation_list'),
             'classes': ('collapse',) # Makes this section collapsible
         }),
     )
 
+    @method_decorator(reporting_view)
+    def changelist_view(self, request, extra_context=None):
+        # Student lists are heavy reads; serve them from the read replica when one is configured.
+        return super().changelist_view(request, extra_context)
+
+    def get_queryset(self, request):
+        """
+        The default manager defers the survey JSON, which the changelist never shows.
+        Every other view (change form, delete confirmation) loads the full row.
+        """
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if not (match and match.url_name == 'core_student_changelist'):
+            queryset = queryset.with_survey_data()
+        return queryset
+
+    @admin.display(description='Recommendations')
+    def recommendation_list(self, obj):
+        return format_html('<pre>{}</pre>', json.dumps(obj.get_recommendations(), indent=2))
+
 @admin.register(RecommendationSetting)
 class RecommendationSettingAdmin(admin.ModelAdmin):
     """
@@ -101,9 +151,28 @@ class RecommendationSettingAdmin(admin.ModelAdmin):
     """
     list_display = ('college', 'subject_group_name', 'num_recommendations')
     list_filter = ('college',)
+    list_select_related = ('college',)
     search_fields = ('college__name', 'subject_group_name')
+    autocomplete_fields = ('college',)
 
 
+@admin.register(CatalogueSnapshot)
+class CatalogueSnapshotAdmin(admin.ModelAdmin):
+    """
+    Read-only history of each college's course catalogue versions and their diffs.
+    Snapshots are recorded automatically when the ReadCourseDetails feed changes.
+    """
+    list_display = ('college', 'version', 'content_hash', 'fetched_at', 'checked_at')
+    list_filter = ('college',)
+    list_select_related = ('college',)
+    readonly_fields = ('college', 'version', 'content_hash', 'diff', 'courses', 'fetched_at', 'checked_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # --- Customizing the User Admin ---
 
 class CollegeUserInline(admin.StackedInline):
@@ -113,6 +182,7 @@ class CollegeUserInline(admin.StackedInline):
     model = CollegeUser
     can_delete = False
     verbose_name_plural = 'College Affiliation'
+    autocomplete_fields = ('college',)
 
 class UserAdmin(BaseUserAdmin):
     """
@@ -120,12 +190,22 @@ class UserAdmin(BaseUserAdmin):
     """
     inlines = (CollegeUserInline,)
 
+@admin.register(CollegeUser)
+class CollegeUserAdmin(admin.ModelAdmin):
+    """
+    Admin view for CollegeUser links.
+    Selects the related user and college up front since __str__ uses both.
+    """
+    list_display = ('user', 'college')
+    list_filter = ('college',)
+    list_select_related = ('user', 'college')
+    search_fields = ('user__username', 'college__name')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('college',)
+
 # Re-register User admin
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
 
-# Unregister the basic model registrations if they were registered before
-# and re-register them with the enhanced admin classes above.
-admin.site.register(CollegeUser)
-# Note: College, Question, Student, and RecommendationSetting are registered using the @admin.register decorator.
+# Note: College, Question, Student, RecommendationSetting and CollegeUser are registered using the @admin.register decorator.
 # The Option model is managed inline, so it does not need to be registered separately.
\ No newline at end of file
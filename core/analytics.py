@@ -0,0 +1,206 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import AnswerStat, Option, Question, RecommendationStat, Student, unpack_recommendations
+
+
+def _answer_counts(responses):
+    """Returns a Counter keyed by (question_id, value) for one set of responses."""
+    counts = Counter()
+    for qid, value in (responses or {}).items():
+        counts[(str(qid), str(value))] += 1
+    return counts
+
+def _recommendation_counts(semester, recommendations):
+    """Returns a Counter keyed by (group, semester, subject, paper) for one set of recommendations."""
+    counts = Counter()
+    for rec in recommendations or []:
+        key = (
+            rec.get('SubjectGroupName', 'Unknown'),
+            semester or '',
+            rec.get('SubjectName', ''),
+            rec.get('PaperName', ''),
+        )
+        counts[key] += 1
+    return counts
+
+def _key_filter(key_fields, keys):
+    """Builds a Q matching any of `keys`, each given as a tuple of `key_fields` values."""
+    condition = Q(pk__in=[])
+    for key in keys:
+        condition |= Q(**dict(zip(key_fields, key)))
+    return condition
+
+def _increment(model, lookup, change):
+    if model.objects.filter(**lookup).update(count=F('count') + change):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=change, **lookup)
+    except IntegrityError:
+        # Another worker created the row between our update and insert.
+        model.objects.filter(**lookup).update(count=F('count') + change)
+
+def _apply_delta(model, college, key_fields, delta):
+    """
+    Adds the (possibly negative) counts in `delta` to the summary rows of `model`.
+
+    Uses F() expressions so concurrent submissions from several workers do not
+    overwrite each other's increments. The work is set-based: one SELECT for the
+    existing rows, one UPDATE per distinct change and one bulk INSERT for new rows,
+    however many answers or recommendations the submission has. Decrements stop at
+    zero, so a row that drifted below its true count still reaches zero.
+    """
+    delta = {key: change for key, change in delta.items() if change}
+    if not delta:
+        return
+
+    existing = set(model.objects.filter(_key_filter(key_fields, delta), college=college).values_list(*key_fields))
+
+    keys_by_change = {}
+    for key, change in delta.items():
+        if change < 0 or key in existing:
+            keys_by_change.setdefault(change, []).append(key)
+    for change, keys in keys_by_change.items():
+        rows = model.objects.filter(_key_filter(key_fields, keys), college=college)
+        rows.update(count=Greatest(F('count') + change, 0))
+
+    missing = [key for key, change in delta.items() if change > 0 and key not in existing]
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([
+                model(college=college, count=delta[key], **dict(zip(key_fields, key))) for key in missing
+            ])
+    except IntegrityError:
+        # Another worker created some of these rows since we looked; add to them one by one.
+        for key in missing:
+            _increment(model, dict(zip(key_fields, key), college=college), delta[key])
+
+def record_submission(student, previous_responses=None, previous_recommendations=None):
+    """
+    Incrementally refreshes the analytics summary tables after a student submits.
+
+    Args:
+        student (Student): The student whose new responses and recommendations were saved.
+        previous_responses (dict): The responses stored before this submission, if any.
+        previous_recommendations (list): The recommendations stored before this submission, if any.
+    """
+    answer_delta = _answer_counts(student.responses)
+    answer_delta.subtract(_answer_counts(previous_responses))
+
+    rec_delta = _recommendation_counts(student.semester, student.get_recommendations())
+    rec_delta.subtract(_recommendation_counts(student.semester, previous_recommendations))
+
+    with transaction.atomic():
+        _apply_delta(AnswerStat, student.college, ('question_id', 'value'), answer_delta)
+        _apply_delta(
+            RecommendationStat, student.college,
+            ('subject_group_name', 'semester', 'subject_name', 'paper_name'), rec_delta
+        )
+
+def rebuild_college_stats(college, chunk_size=500):
+    """
+    Recomputes the analytics summary tables for a college from stored Student rows.
+
+    Students are streamed in chunks so large colleges never have to be held in memory.
+
+    Returns:
+        tuple: The number of (answer, recommendation) summary rows written.
+    """
+    answers = Counter()
+    recommendations = Counter()
+    rows = (
+        Student.objects.filter(college=college)
+        .values_list('semester', 'responses', 'recommendations')
+        .iterator(chunk_size=chunk_size)
+    )
+    for semester, responses, recs in rows:
+        answers.update(_answer_counts(responses))
+        recommendations.update(_recommendation_counts(semester, unpack_recommendations(recs)))
+
+    with transaction.atomic():
+        AnswerStat.objects.filter(college=college).delete()
+        RecommendationStat.objects.filter(college=college).delete()
+        AnswerStat.objects.bulk_create([
+            AnswerStat(college=college, question_id=qid, value=value, count=count)
+            for (qid, value), count in answers.items()
+        ], batch_size=chunk_size)
+        RecommendationStat.objects.bulk_create([
+            RecommendationStat(
+                college=college, subject_group_name=group, semester=semester,
+                subject_name=subject, paper_name=paper, count=count
+            )
+            for (group, semester, subject, paper), count in recommendations.items()
+        ], batch_size=chunk_size)
+
+    return len(answers), len(recommendations)
+
+def answer_distribution(college):
+    """
+    Returns the answer distribution per question for a college.
+
+    Returns:
+        list: One entry per question with the count for each selected option value.
+    """
+    questions = {q.question_id: q.text for q in Question.objects.filter(college=college)}
+    option_text = {
+        (qid, value): text
+        for qid, value, text in Option.objects.filter(question__college=college)
+        .values_list('question__question_id', 'value', 'text')
+    }
+
+    distribution = {}
+    stats = (
+        AnswerStat.objects.filter(college=college, count__gt=0)
+        .order_by('question_id', '-count', 'value')
+        .values_list('question_id', 'value', 'count')
+    )
+    for qid, value, count in stats:
+        entry = distribution.setdefault(qid, {
+            'question_id': qid,
+            'text': questions.get(qid),
+            'total': 0,
+            'answers': [],
+        })
+        entry['total'] += count
+        entry['answers'].append({
+            'value': value,
+            'text': option_text.get((qid, value)),
+            'count': count,
+        })
+    return list(distribution.values())
+
+def top_recommended_courses(college, semester=None, limit=10):
+    """
+    Returns the most-recommended courses per subject group and semester for a college.
+
+    Args:
+        college (College): The college to report on.
+        semester (str): Optional semester name to restrict the report to.
+        limit (int): Maximum number of courses to return per group and semester.
+
+    Returns:
+        list: One entry per (subject group, semester) with its top courses.
+    """
+    stats = RecommendationStat.objects.filter(college=college, count__gt=0)
+    if semester:
+        stats = stats.filter(semester__iexact=semester)
+    stats = stats.order_by('subject_group_name', 'semester', '-count', 'subject_name').values_list(
+        'subject_group_name', 'semester', 'subject_name', 'paper_name', 'count'
+    )
+
+    groups = {}
+    for group, sem, subject, paper, count in stats:
+        entry = groups.setdefault((group, sem), {
+            'subject_group_name': group,
+            'semester': sem,
+            'courses': [],
+        })
+        if len(entry['courses']) < limit:
+            entry['courses'].append({'SubjectName': subject, 'PaperName': paper, 'count': count})
+    return list(groups.values())
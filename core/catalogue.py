@@ -0,0 +1,140 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CatalogueSnapshot, PrecomputedRecommendation, Student
+
+
+def _canonical(course):
+    return json.dumps(course, sort_keys=True, separators=(',', ':'))
+
+def catalogue_hash(available_courses):
+    """Content hash of a course catalogue, independent of course order and key order."""
+    canonical = sorted(_canonical(course) for course in available_courses)
+    return hashlib.sha256(json.dumps(canonical, separators=(',', ':')).encode()).hexdigest()
+
+def course_key(course):
+    """The (SubjectName, PaperName) pair that identifies a course within its group and semester."""
+    return course.get('SubjectName', ''), course.get('PaperName', '')
+
+def _index(courses):
+    index = {}
+    for course in courses:
+        scope = (course.get('SubjectGroupName', 'Unknown'), course.get('SemesterName', ''))
+        index.setdefault(scope, {})[course_key(course)] = _canonical(course)
+    return index
+
+def diff_catalogues(old_courses, new_courses):
+    """
+    Computes a normalized diff between two versions of a catalogue.
+
+    Returns:
+        list: One entry per (subject group, semester) that changed, with the
+        courses added, removed and changed (same key, different details), each
+        given as {"SubjectName", "PaperName"}.
+    """
+    old_index, new_index = _index(old_courses), _index(new_courses)
+    diff = []
+    for group, semester in sorted(set(old_index) | set(new_index)):
+        old = old_index.get((group, semester), {})
+        new = new_index.get((group, semester), {})
+        entry = {
+            'subject_group_name': group,
+            'semester': semester,
+            'added': sorted(set(new) - set(old)),
+            'removed': sorted(set(old) - set(new)),
+            'changed': sorted(key for key in set(old) & set(new) if old[key] != new[key]),
+        }
+        if entry['added'] or entry['removed'] or entry['changed']:
+            for change in ('added', 'removed', 'changed'):
+                entry[change] = [{'SubjectName': s, 'PaperName': p} for s, p in entry[change]]
+            diff.append(entry)
+    return diff
+
+def affected_semesters(diff):
+    """Lower-cased semester names touched by a diff."""
+    return {(entry['semester'] or '').lower() for entry in diff or []}
+
+def latest_snapshot(college):
+    """
+    Returns the college's newest snapshot, or None.
+    The course list is deferred: reading `courses` loads it with one extra query.
+    """
+    return CatalogueSnapshot.objects.filter(college=college).order_by('-version').defer('courses').first()
+
+def record_catalogue(college, available_courses):
+    """
+    Stores a new catalogue version for the college if the feed's content changed.
+
+    When a new version is created, precomputed recommendations are invalidated
+    precisely: entries for semesters the diff touches are deleted, and the others
+    are re-stamped with the new catalogue hash so they stay usable. An unchanged
+    feed only touches `checked_at`, at most once per CATALOGUE_CHECK_INTERVAL, so
+    concurrent submissions do not all write the same row.
+
+    Args:
+        college (College): The college the feed belongs to.
+        available_courses (list): The courses just fetched from ReadCourseDetails.
+
+    Returns:
+        CatalogueSnapshot: The snapshot matching the fetched feed.
+    """
+    content_hash = catalogue_hash(available_courses)
+    now = timezone.now()
+    previous = latest_snapshot(college)
+    if previous is not None and previous.content_hash == content_hash:
+        if previous.checked_at <= now - timedelta(seconds=settings.CATALOGUE_CHECK_INTERVAL):
+            CatalogueSnapshot.objects.filter(pk=previous.pk).update(checked_at=now)
+            previous.checked_at = now
+        return previous
+
+    # Only a changed feed needs the previous course list (loaded here, deferred above)
+    diff = diff_catalogues(previous.courses, available_courses) if previous else None
+    try:
+        with transaction.atomic():
+            snapshot = CatalogueSnapshot.objects.create(
+                college=college,
+                version=previous.version + 1 if previous else 1,
+                content_hash=content_hash,
+                courses=available_courses,
+                diff=diff,
+                checked_at=now,
+            )
+            if previous is not None:
+                stale = PrecomputedRecommendation.objects.filter(college=college, catalogue_hash=previous.content_hash)
+                semesters = affected_semesters(diff)
+                # Precomputed entries without a semester see every group, so any change affects them.
+                stale.filter(Q(semester__in=semesters) | Q(semester='')).delete()
+                stale.update(catalogue_hash=content_hash)
+    except IntegrityError:
+        # Another worker stored this version first.
+        snapshot = latest_snapshot(college)
+    return snapshot
+
+def affected_students(snapshot):
+    """
+    Returns the students whose stored recommendations may be stale as of `snapshot`.
+
+    A student is affected by a catalogue change when their recommendations were
+    generated from an earlier version (or before versioning existed) and the change
+    touches their semester. Students without a semester see every group, so any
+    change affects them.
+    """
+    changes = CatalogueSnapshot.objects.filter(
+        college=snapshot.college_id, version__lte=snapshot.version, diff__isnull=False
+    ).values_list('version', 'diff')
+
+    condition = Q(pk__in=[])
+    for version, diff in changes:
+        semester_match = Q(semester='')
+        for semester in affected_semesters(diff):
+            semester_match |= Q(semester__iexact=semester)
+        older = Q(catalogue_version__lt=version) | Q(catalogue_version__isnull=True)
+        condition |= older & semester_match
+
+    return Student.objects.filter(condition, college=snapshot.college_id, recommendations__isnull=False)
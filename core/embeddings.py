@@ -0,0 +1,193 @@
+import hashlib
+import io
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+
+from .models import CatalogueSnapshot, CourseEmbedding
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Catalogue versions never change once stored, so their matrices are kept per process.
+# gthread workers share the cache between threads, so it is only touched under the lock.
+MATRIX_CACHE_SIZE = 32
+_matrix_cache = {}
+_matrix_cache_lock = threading.Lock()
+
+
+class HashingEmbedder:
+    """
+    Dependency-free default embedder.
+
+    Hashes word unigrams and bigrams into signed buckets (the "hashing trick"), which is
+    enough to rank courses by vocabulary overlap with the student's answers and gives the
+    same vectors in every process.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        words = TOKEN_RE.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+                matrix[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        return matrix
+
+class SentenceTransformerEmbedder:
+    """
+    Local CPU sentence-transformers model.
+    The package is optional and only imported when the first text is embedded.
+    """
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        self.model_name = model_name
+        self.name = f"sentence-transformers/{model_name}"
+        self._model = None
+
+    def embed(self, texts):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+        return np.asarray(self._model.encode(list(texts)), dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def _load_embedder(path):
+    return import_string(path)()
+
+def get_embedder():
+    """Returns the embedder configured by COURSE_EMBEDDER (one instance per process)."""
+    return _load_embedder(settings.COURSE_EMBEDDER)
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def _course_key(course):
+    return (
+        course.get('SubjectGroupName', 'Unknown'), course.get('SemesterName', ''),
+        course.get('SubjectName', ''), course.get('PaperName', ''),
+    )
+
+def course_text(course):
+    """The text a course is embedded from: every descriptive string field except the semester."""
+    return ' '.join(value for key, value in sorted(course.items()) if isinstance(value, str) and key != 'SemesterName')
+
+def responses_text(enriched_responses):
+    """The text a student's answers are embedded from (question and selected option text)."""
+    return ' '.join(f"{question} {answer}" for question, answer in enriched_responses.items())
+
+def _to_bytes(matrix):
+    buffer = io.BytesIO()
+    np.save(buffer, matrix, allow_pickle=False)
+    return buffer.getvalue()
+
+def _from_bytes(data):
+    return np.load(io.BytesIO(bytes(data)), allow_pickle=False)
+
+def catalogue_vectors(college_id, version, embedder=None):
+    """
+    Returns the course vectors of a catalogue version, computing and storing them on first use.
+
+    Args:
+        college_id (int): The college the catalogue belongs to.
+        version (int): The CatalogueSnapshot version.
+        embedder: The embedder to use; defaults to get_embedder().
+
+    Returns:
+        tuple: (matrix, index) where `matrix` holds one L2-normalized row per course of the
+        snapshot and `index` maps a course's (group, semester, subject, paper) to its row,
+        or (None, None) when the version does not exist.
+    """
+    embedder = embedder or get_embedder()
+    key = (college_id, version, embedder.name)
+    with _matrix_cache_lock:
+        cached = _matrix_cache.get(key)
+    if cached is not None:
+        return cached
+
+    snapshot = CatalogueSnapshot.objects.filter(college=college_id, version=version).first()
+    if snapshot is None:
+        return None, None
+
+    stored = CourseEmbedding.objects.filter(snapshot=snapshot, embedder=embedder.name).values_list('vectors', flat=True).first()
+    if stored is not None:
+        matrix = _from_bytes(stored)
+    else:
+        matrix = _normalize(embedder.embed([course_text(course) for course in snapshot.courses]))
+        try:
+            with transaction.atomic():
+                CourseEmbedding.objects.create(
+                    snapshot=snapshot, embedder=embedder.name, dim=matrix.shape[1], vectors=_to_bytes(matrix)
+                )
+        except IntegrityError:
+            # Another worker stored the vectors of this version first.
+            pass
+
+    index = {_course_key(course): row for row, course in enumerate(snapshot.courses)}
+    with _matrix_cache_lock:
+        if key not in _matrix_cache and len(_matrix_cache) >= MATRIX_CACHE_SIZE:
+            _matrix_cache.pop(next(iter(_matrix_cache)), None)
+        _matrix_cache[key] = matrix, index
+    return matrix, index
+
+def shortlist_groups(student, groups, enriched_responses):
+    """
+    Trims subject groups larger than COURSE_SHORTLIST_SIZE to the courses most similar
+    to the student's answers, so big catalogues cost fewer prompt tokens.
+
+    Course vectors come from the stored matrix of the student's catalogue version; the
+    cosine similarity of every course is computed with one matrix-vector product.
+    Shortlisted courses keep their catalogue order. A group is sent whole when fewer
+    courses than it would keep score above COURSE_SHORTLIST_MIN_SCORE: the cut would
+    then fall among courses unrelated to the answers and be close to arbitrary.
+
+    Args:
+        student (Student): The student, with `catalogue_version` set when available.
+        groups (list): (group_name, courses, num_recommendations) tuples.
+        enriched_responses (dict): The student's answers as {question text: option text}.
+
+    Returns:
+        list: The groups, with large course lists shortlisted.
+    """
+    limit = settings.COURSE_SHORTLIST_SIZE
+    if not limit or not enriched_responses or all(len(courses) <= max(limit, num) for _, courses, num in groups):
+        return groups
+
+    embedder = get_embedder()
+    query = _normalize(embedder.embed([responses_text(enriched_responses)]))[0]
+    if not query.any():
+        return groups
+
+    matrix, index = (None, None)
+    if student.catalogue_version is not None:
+        matrix, index = catalogue_vectors(student.college_id, student.catalogue_version, embedder)
+    scores = matrix @ query if matrix is not None else None
+
+    shortlisted = []
+    for group_name, courses, num_recommend in groups:
+        keep = max(limit, num_recommend)
+        if len(courses) > keep:
+            rows = [index.get(_course_key(course)) for course in courses] if index else [None]
+            if None in rows:
+                # Courses outside the stored version (e.g. no snapshot yet) are embedded on the fly.
+                group_scores = _normalize(embedder.embed([course_text(course) for course in courses])) @ query
+            else:
+                group_scores = scores[rows]
+            if np.count_nonzero(group_scores > settings.COURSE_SHORTLIST_MIN_SCORE) >= keep:
+                top = np.sort(np.argpartition(-group_scores, keep - 1)[:keep])
+                courses = [courses[i] for i in top]
+        shortlisted.append((group_name, courses, num_recommend))
+    return shortlisted
@@ -0,0 +1,94 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a Gunicorn worker imports before serving its first request.
+BOOT_SNIPPET = """
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+from college_management.wsgi import application
+"""
+
+# Heavy packages that must only be imported lazily, when a recommendation is generated.
+LAZY_MODULES = ('google.generativeai', 'grpc', 'google.protobuf')
+
+
+def parse_importtime(stderr):
+    """
+    Parses `python -X importtime` output.
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) tuples in import order.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks worker cold start with `python -X importtime` and the wall-clock latency of "
+        "`manage.py check`, and fails if heavy SDKs are imported at startup or budgets are exceeded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Repetitions for each measurement.")
+        parser.add_argument('--top', type=int, default=15, help="Slowest top-level imports to list.")
+        parser.add_argument('--max-import-ms', type=float, help="Fail if the median boot import time exceeds this.")
+        parser.add_argument('--max-manage-ms', type=float, help="Fail if the median `manage.py check` time exceeds this.")
+
+    def _run(self, args):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'college_management.settings'))
+        started = time.perf_counter()
+        result = subprocess.run(args, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        elapsed = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise CommandError(f"`{' '.join(args)}` failed:\n{result.stderr[-2000:]}")
+        return result, elapsed
+
+    def handle(self, *args, **options):
+        runs = max(options['runs'], 1)
+
+        import_totals, boot_walls, rows = [], [], []
+        for _ in range(runs):
+            result, wall = self._run([sys.executable, '-X', 'importtime', '-c', BOOT_SNIPPET])
+            rows = parse_importtime(result.stderr)
+            import_totals.append(sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000)
+            boot_walls.append(wall)
+
+        manage_walls = [self._run([sys.executable, 'manage.py', 'check'])[1] for _ in range(runs)]
+
+        import_ms = statistics.median(import_totals)
+        manage_ms = statistics.median(manage_walls)
+        self.stdout.write(f"Worker boot imports: {import_ms:.0f} ms (median of {runs}), process wall {statistics.median(boot_walls):.0f} ms")
+        self.stdout.write(f"manage.py check:     {manage_ms:.0f} ms (median of {runs})")
+
+        self.stdout.write("\nSlowest top-level imports (last run):")
+        top_level = sorted((r for r in rows if r[3] == 0), key=lambda r: r[2], reverse=True)
+        for name, _, cumulative, _ in top_level[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+        failures = []
+        eager = sorted({name for name, *_ in rows if name.startswith(LAZY_MODULES)})
+        if eager:
+            failures.append(f"Heavy modules imported at startup: {', '.join(eager[:10])}")
+        if options['max_import_ms'] is not None and import_ms > options['max_import_ms']:
+            failures.append(f"Boot import time {import_ms:.0f} ms exceeds {options['max_import_ms']:.0f} ms")
+        if options['max_manage_ms'] is not None and manage_ms > options['max_manage_ms']:
+            failures.append(f"manage.py check took {manage_ms:.0f} ms, over {options['max_manage_ms']:.0f} ms")
+
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("\nStartup budget OK"))
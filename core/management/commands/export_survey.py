@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import College
+from core.surveys import export_survey, survey_to_csv
+
+
+class Command(BaseCommand):
+    help = "Exports a college's questions and options as JSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('college_name')
+        parser.add_argument('path', nargs='?', help="Output file. Writes to stdout when omitted.")
+        parser.add_argument('--format', choices=['json', 'csv'], default='json')
+
+    def handle(self, *args, **options):
+        try:
+            college = College.objects.get(name=options['college_name'])
+        except College.DoesNotExist:
+            raise CommandError(f"College with name '{options['college_name']}' does not exist.")
+
+        questions = export_survey(college)
+        if options['format'] == 'csv':
+            content = survey_to_csv(questions)
+        else:
+            content = json.dumps({"college_name": college.name, "questions": questions}, indent=2)
+
+        if options['path']:
+            with open(options['path'], 'w', encoding='utf-8', newline='') as f:
+                f.write(content)
+        else:
+            self.stdout.write(content)
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import College
+from core.serializers import SurveyQuestionSerializer
+from core.surveys import import_survey, parse_survey_csv
+
+
+class Command(BaseCommand):
+    help = "Upserts a college's questions and options from a JSON or CSV file in one transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('college_name')
+        parser.add_argument('path', help="A .json file (list or {\"questions\": [...]}) or a .csv file.")
+        parser.add_argument('--replace', action='store_true', help="Delete questions that are not in the file.")
+
+    def handle(self, *args, **options):
+        try:
+            college = College.objects.get(name=options['college_name'])
+        except College.DoesNotExist:
+            raise CommandError(f"College with name '{options['college_name']}' does not exist.")
+
+        path = options['path']
+        with open(path, encoding='utf-8-sig') as f:
+            content = f.read()
+
+        try:
+            if path.lower().endswith('.csv'):
+                data = parse_survey_csv(content)
+            else:
+                data = json.loads(content)
+                if isinstance(data, dict):
+                    data = data.get('questions', [])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        serializer = SurveyQuestionSerializer(data=data, many=True)
+        if not serializer.is_valid():
+            raise CommandError(json.dumps(serializer.errors, indent=2))
+
+        try:
+            result = import_survey(college, serializer.validated_data, replace=options['replace'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{college.name}: {result['questions']} questions, {result['options']} options imported, "
+            f"{result['deleted']} objects deleted"
+        )
@@ -0,0 +1,43 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import College
+from core.precompute import precompute_college
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes recommendations for the most frequent answer profiles of each college. "
+        "Schedule it (e.g. nightly) so submit-answers can skip the LLM for common profiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--college', help="Only precompute the college with this name.")
+        parser.add_argument('--top', type=int, default=50, help="Profiles to precompute per college.")
+        parser.add_argument('--min-students', type=int, default=2, help="Minimum students sharing a profile.")
+        parser.add_argument(
+            '--if-changed', action='store_true',
+            help="Skip colleges whose entries already match the current catalogue and settings."
+        )
+
+    def handle(self, *args, **options):
+        colleges = College.objects.all()
+        if options['college']:
+            colleges = colleges.filter(name=options['college'])
+            if not colleges.exists():
+                raise CommandError(f"College with name '{options['college']}' does not exist.")
+
+        for college in colleges:
+            try:
+                count = precompute_college(
+                    college, top=options['top'], min_students=options['min_students'],
+                    only_if_changed=options['if_changed']
+                )
+            except requests.exceptions.RequestException as e:
+                self.stderr.write(f"{college.name}: failed to fetch courses: {e}")
+                continue
+
+            if count is None:
+                self.stdout.write(f"{college.name}: up to date")
+            else:
+                self.stdout.write(f"{college.name}: {count} profiles precomputed")
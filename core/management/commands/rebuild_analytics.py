@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.analytics import rebuild_college_stats
+from core.models import College
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the answer and recommendation summary tables from stored student data."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--college', help="Only rebuild the college with this name.")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Students streamed per database round trip.")
+
+    def handle(self, *args, **options):
+        colleges = College.objects.all()
+        if options['college']:
+            colleges = colleges.filter(name=options['college'])
+            if not colleges.exists():
+                raise CommandError(f"College with name '{options['college']}' does not exist.")
+
+        for college in colleges:
+            answers, recommendations = rebuild_college_stats(college, chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f"{college.name}: {answers} answer rows, {recommendations} recommendation rows"
+            )
@@ -0,0 +1,91 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.analytics import record_submission
+from core.catalogue import affected_students, latest_snapshot, record_catalogue
+from core.embeddings import catalogue_vectors
+from core.models import College
+from core.ratelimit import LLMUnavailable
+from core.precompute import lookup_precomputed
+from core.services import fetch_available_courses, generate_course_recommendations
+from core.surveys import get_answer_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetches every college's course catalogue, stores a new version when it changed "
+        "and optionally regenerates recommendations for the students the change affects. "
+        "Meant to be run on a schedule."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--college', help="Only refresh the college with this name.")
+        parser.add_argument(
+            '--rerun-affected', action='store_true',
+            help="Regenerate recommendations of students whose semester is touched by a catalogue change."
+        )
+
+    def handle(self, *args, **options):
+        colleges = College.objects.all()
+        if options['college']:
+            colleges = colleges.filter(name=options['college'])
+            if not colleges.exists():
+                raise CommandError(f"College with name '{options['college']}' does not exist.")
+
+        for college in colleges:
+            try:
+                available_courses = fetch_available_courses(college)
+            except requests.exceptions.RequestException as e:
+                self.stderr.write(f"{college.name}: failed to fetch courses: {e}")
+                continue
+
+            previous = latest_snapshot(college)
+            snapshot = record_catalogue(college, available_courses)
+            if previous is None:
+                self.stdout.write(f"{college.name}: first catalogue snapshot v{snapshot.version}")
+            elif previous.pk == snapshot.pk:
+                self.stdout.write(f"{college.name}: catalogue v{snapshot.version} unchanged")
+            else:
+                self.stdout.write(
+                    f"{college.name}: catalogue v{snapshot.version} "
+                    f"({len(snapshot.diff or [])} changed group/semester pairs)"
+                )
+            if previous is None or previous.pk != snapshot.pk:
+                # Store the new version's course vectors now rather than on the first submission
+                if settings.COURSE_SHORTLIST_SIZE:
+                    catalogue_vectors(college.pk, snapshot.version)
+
+            if options['rerun_affected']:
+                rerun = self.rerun_affected(snapshot, available_courses)
+                self.stdout.write(f"{college.name}: regenerated recommendations for {rerun} students")
+
+    def rerun_affected(self, snapshot, available_courses):
+        count = skipped = unavailable = 0
+        schema = get_answer_schema(snapshot.college)
+        students = affected_students(snapshot).with_survey_data().select_related('college')
+        for student in students.iterator(chunk_size=100):
+            # Students whose stored answers no longer match the survey are left for them to resubmit
+            _, errors = schema.validate(student.responses)
+            if errors:
+                skipped += 1
+                continue
+            previous_recommendations = student.get_recommendations()
+            recommendations = lookup_precomputed(student, available_courses)
+            if recommendations is None:
+                try:
+                    recommendations = generate_course_recommendations(student, available_courses)['recommendations']
+                except LLMUnavailable:
+                    # Keep the student's previous recommendations; a later run regenerates them
+                    unavailable += 1
+                    continue
+            student.set_recommendations(recommendations)
+            student.catalogue_version = snapshot.version
+            student.save(update_fields=['recommendations', 'catalogue_version'])
+            record_submission(student, student.responses, previous_recommendations)
+            count += 1
+        if skipped:
+            self.stderr.write(f"{snapshot.college.name}: skipped {skipped} students whose answers no longer match the survey")
+        if unavailable:
+            self.stderr.write(f"{snapshot.college.name}: LLM unavailable for {unavailable} students, left for the next run")
+        return count
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_college_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject_group_name', models.CharField(max_length=255)),
+                ('semester', models.CharField(max_length=20)),
+                ('subject_name', models.CharField(max_length=255)),
+                ('paper_name', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.college')),
+            ],
+            options={
+                'unique_together': {('college', 'subject_group_name', 'semester', 'subject_name', 'paper_name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AnswerStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_id', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.college')),
+            ],
+            options={
+                'unique_together': {('college', 'question_id', 'value')},
+            },
+        ),
+    ]
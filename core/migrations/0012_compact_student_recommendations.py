@@ -0,0 +1,65 @@
+from django.db import migrations
+
+
+# Frozen copies of core.models.pack_recommendations / unpack_recommendations as of this
+# migration, so later changes to the live helpers cannot alter what it does.
+def pack_recommendations(recommendations):
+    groups = {}
+    for rec in recommendations:
+        rec = dict(rec)
+        group = rec.pop('SubjectGroupName', 'Unknown')
+        ref = [rec.pop('SubjectName', ''), rec.pop('PaperName', '')]
+        if rec:
+            ref.append(rec)
+        groups.setdefault(group, []).append(ref)
+    return {'v': 1, 'groups': [[group, refs] for group, refs in groups.items()]}
+
+
+def unpack_recommendations(stored):
+    recommendations = []
+    for group, refs in stored.get('groups', []):
+        for ref in refs:
+            rec = {'SubjectName': ref[0], 'PaperName': ref[1], 'SubjectGroupName': group}
+            if len(ref) > 2:
+                rec.update(ref[2])
+            recommendations.append(rec)
+    return recommendations
+
+
+def pack_existing(apps, schema_editor):
+    Student = apps.get_model('core', 'Student')
+    batch = []
+    students = Student.objects.filter(recommendations__isnull=False).only('id', 'recommendations')
+    for student in students.iterator(chunk_size=500):
+        if isinstance(student.recommendations, list):
+            student.recommendations = pack_recommendations(student.recommendations)
+            batch.append(student)
+        if len(batch) >= 500:
+            Student.objects.bulk_update(batch, ['recommendations'])
+            batch = []
+    Student.objects.bulk_update(batch, ['recommendations'])
+
+
+def unpack_existing(apps, schema_editor):
+    Student = apps.get_model('core', 'Student')
+    batch = []
+    students = Student.objects.filter(recommendations__isnull=False).only('id', 'recommendations')
+    for student in students.iterator(chunk_size=500):
+        if isinstance(student.recommendations, dict):
+            student.recommendations = unpack_recommendations(student.recommendations)
+            batch.append(student)
+        if len(batch) >= 500:
+            Student.objects.bulk_update(batch, ['recommendations'])
+            batch = []
+    Student.objects.bulk_update(batch, ['recommendations'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_answerstat_recommendationstat'),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_existing, unpack_existing),
+    ]
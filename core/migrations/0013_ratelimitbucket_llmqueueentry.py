@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_compact_student_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('available_requests', models.FloatField()),
+                ('available_tokens', models.FloatField()),
+                ('refilled_at', models.DateTimeField()),
+                ('last_granted_at', models.DateTimeField(blank=True, null=True)),
+                ('granted_count', models.PositiveBigIntegerField(default=0)),
+                ('waited_count', models.PositiveBigIntegerField(default=0)),
+                ('total_wait_seconds', models.FloatField(default=0)),
+                ('max_wait_seconds', models.FloatField(default=0)),
+                ('college', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.college')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LLMQueueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estimated_tokens', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.college')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='core_llmque_created_913e07_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_ratelimitbucket_llmqueueentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.CharField(max_length=20)),
+                ('profile_hash', models.CharField(max_length=64)),
+                ('responses', models.JSONField()),
+                ('recommendations', models.JSONField()),
+                ('student_count', models.PositiveIntegerField(default=0)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('catalogue_hash', models.CharField(max_length=64)),
+                ('settings_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.college')),
+            ],
+            options={
+                'unique_together': {('college', 'semester', 'profile_hash')},
+            },
+        ),
+    ]
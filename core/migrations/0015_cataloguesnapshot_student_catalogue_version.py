@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_precomputedrecommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='catalogue_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CatalogueSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('courses', models.JSONField()),
+                ('diff', models.JSONField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField(auto_now_add=True)),
+                ('checked_at', models.DateTimeField()),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.college')),
+            ],
+            options={
+                'get_latest_by': 'version',
+                'unique_together': {('college', 'version')},
+            },
+        ),
+    ]
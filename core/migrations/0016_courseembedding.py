@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_cataloguesnapshot_student_catalogue_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('embedder', models.CharField(max_length=100)),
+                ('dim', models.PositiveIntegerField()),
+                ('vectors', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='core.cataloguesnapshot')),
+            ],
+            options={
+                'unique_together': {('snapshot', 'embedder')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_courseembedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='college',
+            name='survey_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_college_survey_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='llmqueueentry',
+            name='heartbeat_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='llmqueueentry',
+            index=models.Index(fields=['heartbeat_at'], name='core_llmque_heartbe_d4ab53_idx'),
+        ),
+    ]
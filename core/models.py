@@ -1,10 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class College(models.Model):
     college_id = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=200, unique=True)
     base_url = models.URLField()
+    # Bumped on every survey change; part of the survey cache keys so all workers stop using stale entries
+    survey_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -36,6 +39,67 @@ class Option(models.Model):
     def __str__(self):
         return f"{self.question.text[:30]} - {self.text}"
 
+SURVEY_DATA_FIELDS = ('responses', 'recommendations')
+COMPACT_RECOMMENDATIONS_VERSION = 1
+
+def pack_recommendations(recommendations):
+    """
+    Converts a list of recommendation dicts into the compact storage form.
+
+    Each subject group name is stored once, followed by [SubjectName, PaperName]
+    references into that group of the college's course catalogue:
+
+        {"v": 1, "groups": [["Group A", [["Subject", "Paper"], ...]], ...]}
+
+    Any extra keys on a recommendation are kept as a third element so the
+    conversion is lossless. Groups are kept as a list (not an object) because
+    Postgres jsonb does not preserve key order.
+    """
+    if recommendations is None:
+        return None
+    groups = {}
+    for rec in recommendations:
+        rec = dict(rec)
+        group = rec.pop('SubjectGroupName', 'Unknown')
+        ref = [rec.pop('SubjectName', ''), rec.pop('PaperName', '')]
+        if rec:
+            ref.append(rec)
+        groups.setdefault(group, []).append(ref)
+    return {'v': COMPACT_RECOMMENDATIONS_VERSION, 'groups': [[group, refs] for group, refs in groups.items()]}
+
+def unpack_recommendations(stored):
+    """
+    Expands stored recommendations back into the list of dicts returned by the API.
+    Rows saved before the compact format was introduced (plain lists) are returned as-is.
+    """
+    if stored is None or isinstance(stored, list):
+        return stored
+    recommendations = []
+    for group, refs in stored.get('groups', []):
+        for ref in refs:
+            rec = {'SubjectName': ref[0], 'PaperName': ref[1], 'SubjectGroupName': group}
+            if len(ref) > 2:
+                rec.update(ref[2])
+            recommendations.append(rec)
+    return recommendations
+
+class StudentQuerySet(models.QuerySet):
+    def with_survey_data(self, *fields):
+        """
+        Loads the deferred survey JSON columns.
+        Pass field names to load only some of them, e.g. with_survey_data('recommendations').
+        """
+        fields = fields or SURVEY_DATA_FIELDS
+        return self.defer(None).defer(*[f for f in SURVEY_DATA_FIELDS if f not in fields])
+
+class StudentManager(models.Manager.from_queryset(StudentQuerySet)):
+    """
+    Defers the responses/recommendations JSON by default.
+    Most student queries (existence checks, lists, admin) never read them.
+    """
+    def get_queryset(self):
+        return super().get_queryset().defer(*SURVEY_DATA_FIELDS)
+
 class Student(models.Model):
     student_id = models.CharField(max_length=20)
     name = models.CharField(max_length=100)
@@ -44,17 +108,151 @@ class Student(models.Model):
     college = models.ForeignKey(College, on_delete=models.CASCADE)
     responses = models.JSONField(null=True, blank=True)
     recommendations = models.JSONField(null=True, blank=True)
+    # CatalogueSnapshot.version the stored recommendations were generated from
+    catalogue_version = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = StudentManager()
+
     class Meta:
         unique_together = ('college', 'student_id')
 
     def __str__(self):
         return f"{self.name} ({self.student_id})"
 
+    def get_recommendations(self):
+        """Returns the stored recommendations as a list of dicts."""
+        return unpack_recommendations(self.recommendations)
+
+    def set_recommendations(self, recommendations):
+        """Stores a list of recommendation dicts in the compact form."""
+        self.recommendations = pack_recommendations(recommendations)
+
 class CollegeUser(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     college = models.ForeignKey(College, on_delete=models.CASCADE)
 
     def __str__(self):
-        return f"{self.college.name} - {self.user.username}"
\ No newline at end of file
+        return f"{self.college.name} - {self.user.username}"
+
+class AnswerStat(models.Model):
+    """Running count of how many students picked an option value for a question."""
+    college = models.ForeignKey(College, on_delete=models.CASCADE)
+    question_id = models.CharField(max_length=50)
+    value = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('college', 'question_id', 'value')
+
+    def __str__(self):
+        return f"{self.question_id} = {self.value} ({self.count})"
+
+class RecommendationStat(models.Model):
+    """Running count of how often a course was recommended per subject group and semester."""
+    college = models.ForeignKey(College, on_delete=models.CASCADE)
+    subject_group_name = models.CharField(max_length=255)
+    semester = models.CharField(max_length=20)
+    subject_name = models.CharField(max_length=255)
+    paper_name = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('college', 'subject_group_name', 'semester', 'subject_name', 'paper_name')
+
+    def __str__(self):
+        return f"{self.subject_group_name} / {self.semester} - {self.subject_name} ({self.count})"
+
+class RateLimitBucket(models.Model):
+    """
+    Token-bucket state for LLM calls, shared by every worker through the database.
+    One row holds the global budget ("global"), and one row per college ("college:<id>").
+    Also accumulates queue wait metrics for the scope.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    college = models.ForeignKey(College, on_delete=models.CASCADE, null=True, blank=True)
+    available_requests = models.FloatField()
+    available_tokens = models.FloatField()
+    refilled_at = models.DateTimeField()
+    last_granted_at = models.DateTimeField(null=True, blank=True)
+    granted_count = models.PositiveBigIntegerField(default=0)
+    waited_count = models.PositiveBigIntegerField(default=0)
+    total_wait_seconds = models.FloatField(default=0)
+    max_wait_seconds = models.FloatField(default=0)
+
+    def __str__(self):
+        return self.key
+
+class LLMQueueEntry(models.Model):
+    """A pending LLM call waiting for rate-limit budget; removed once granted or abandoned."""
+    college = models.ForeignKey(College, on_delete=models.CASCADE)
+    estimated_tokens = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by the waiting worker on every poll; an entry that stops beating was left by a killed worker
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at']), models.Index(fields=['heartbeat_at'])]
+
+    def __str__(self):
+        return f"{self.college_id} @ {self.created_at}"
+
+class PrecomputedRecommendation(models.Model):
+    """
+    Recommendations generated ahead of time for a frequent answer profile.
+    A row is only used while the catalogue and recommendation settings it was built from are unchanged.
+    """
+    college = models.ForeignKey(College, on_delete=models.CASCADE)
+    semester = models.CharField(max_length=20)
+    profile_hash = models.CharField(max_length=64)
+    responses = models.JSONField()
+    recommendations = models.JSONField()
+    student_count = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    catalogue_hash = models.CharField(max_length=64)
+    settings_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('college', 'semester', 'profile_hash')
+
+    def __str__(self):
+        return f"{self.college_id} / {self.semester} - {self.profile_hash[:12]} ({self.student_count})"
+
+class CatalogueSnapshot(models.Model):
+    """
+    A version of a college's ReadCourseDetails feed.
+    A new version is stored only when the feed's content hash changes, together with
+    the normalized diff against the previous version.
+    """
+    college = models.ForeignKey(College, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField()
+    content_hash = models.CharField(max_length=64)
+    courses = models.JSONField()
+    diff = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField(auto_now_add=True)
+    checked_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('college', 'version')
+        get_latest_by = 'version'
+
+    def __str__(self):
+        return f"{self.college.name} v{self.version}"
+
+class CourseEmbedding(models.Model):
+    """
+    Course vectors of one catalogue version, computed by one embedder.
+    `vectors` holds a float32 NumPy matrix (in .npy format) whose rows follow `snapshot.courses`.
+    """
+    snapshot = models.ForeignKey(CatalogueSnapshot, on_delete=models.CASCADE, related_name='embeddings')
+    embedder = models.CharField(max_length=100)
+    dim = models.PositiveIntegerField()
+    vectors = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('snapshot', 'embedder')
+
+    def __str__(self):
+        return f"{self.snapshot} - {self.embedder} ({self.dim}d)"
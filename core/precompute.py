@@ -0,0 +1,150 @@
+import hashlib
+import json
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import PrecomputedRecommendation, RecommendationSetting, Student, pack_recommendations, unpack_recommendations
+from .services import fetch_available_courses, generate_course_recommendations
+from .catalogue import catalogue_hash, record_catalogue
+from .ratelimit import LLMUnavailable
+from .surveys import get_answer_schema
+
+
+def _digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def normalize_responses(responses):
+    """Returns the canonical form of a set of responses: string keys and values, sorted by question id."""
+    return {str(qid): str(value) for qid, value in sorted((responses or {}).items())}
+
+def profile_hash(responses):
+    return _digest(normalize_responses(responses))
+
+def settings_hash(college):
+    """Hash of a college's recommendation settings; changes whenever a group or its count changes."""
+    return _digest(sorted(
+        RecommendationSetting.objects.filter(college=college).values_list('subject_group_name', 'num_recommendations')
+    ))
+
+def lookup_precomputed(student, available_courses):
+    """
+    Returns precomputed recommendations for the student's answer profile, or None.
+
+    Rows built from a different catalogue or different recommendation settings are ignored.
+
+    Args:
+        student (Student): The student with their new responses set.
+        available_courses (list): The catalogue just fetched from the college.
+
+    Returns:
+        list: The recommendations, or None when there is no fresh precomputed entry.
+    """
+    lookup = {
+        'college': student.college,
+        'semester': (student.semester or '').lower(),
+        'profile_hash': profile_hash(student.responses),
+        'catalogue_hash': catalogue_hash(available_courses),
+        'settings_hash': settings_hash(student.college),
+    }
+    stored = PrecomputedRecommendation.objects.filter(**lookup).values_list('pk', 'recommendations').first()
+    if stored is None:
+        return None
+    PrecomputedRecommendation.objects.filter(pk=stored[0]).update(hit_count=F('hit_count') + 1)
+    return unpack_recommendations(stored[1])
+
+def invalidate_precomputed(college):
+    """Drops a college's precomputed recommendations, e.g. after its survey questions change."""
+    PrecomputedRecommendation.objects.filter(college=college).delete()
+
+def frequent_profiles(college, top=50, min_students=2, chunk_size=500):
+    """
+    Finds the most frequent (semester, responses) profiles among a college's stored students.
+
+    Returns:
+        list: (semester, normalized_responses, student_count) tuples, most frequent first.
+    """
+    counts = Counter()
+    samples = {}
+    rows = (
+        Student.objects.filter(college=college, responses__isnull=False)
+        .values_list('semester', 'responses')
+        .iterator(chunk_size=chunk_size)
+    )
+    for semester, responses in rows:
+        if not responses:
+            continue
+        normalized = normalize_responses(responses)
+        key = ((semester or '').lower(), _digest(normalized))
+        counts[key] += 1
+        samples.setdefault(key, normalized)
+
+    return [
+        (semester, samples[(semester, digest)], count)
+        for (semester, digest), count in counts.most_common(top)
+        if count >= min_students
+    ]
+
+def precompute_college(college, top=50, min_students=2, only_if_changed=False):
+    """
+    Regenerates the precomputed recommendation table for one college.
+
+    Fetches the catalogue once, generates recommendations for each frequent profile
+    and replaces the college's previous entries.
+
+    Args:
+        college (College): The college to precompute.
+        top (int): Maximum number of profiles to precompute.
+        min_students (int): Minimum number of students sharing a profile.
+        only_if_changed (bool): Skip the college when its existing entries were built
+            from the current catalogue and settings.
+
+    Returns:
+        int: The number of profiles precomputed, or None when skipped.
+
+    Raises:
+        requests.exceptions.RequestException: If the college catalogue cannot be fetched.
+    """
+    available_courses = fetch_available_courses(college)
+    snapshot = record_catalogue(college, available_courses)
+    current_catalogue = snapshot.content_hash
+    current_settings = settings_hash(college)
+
+    existing = PrecomputedRecommendation.objects.filter(college=college)
+    if only_if_changed and existing.exists() and not existing.exclude(
+        catalogue_hash=current_catalogue, settings_hash=current_settings
+    ).exists():
+        return None
+
+    # Profiles whose stored answers no longer match the survey are not worth an LLM call
+    profiles = frequent_profiles(college, top=top, min_students=min_students)
+    results = get_answer_schema(college).validate_many([responses for _, responses, _ in profiles])
+
+    entries = []
+    for (semester, _, count), (responses, errors) in zip(profiles, results):
+        if errors:
+            continue
+        student = Student(college=college, semester=semester, responses=responses, catalogue_version=snapshot.version)
+        try:
+            recommendations = generate_course_recommendations(student, available_courses)['recommendations']
+        except LLMUnavailable as e:
+            print(f"Skipping a profile of college '{college.name}': {e}")
+            continue
+        if not recommendations:
+            continue
+        entries.append(PrecomputedRecommendation(
+            college=college,
+            semester=semester,
+            profile_hash=profile_hash(responses),
+            responses=responses,
+            recommendations=pack_recommendations(recommendations),
+            student_count=count,
+            catalogue_hash=current_catalogue,
+            settings_hash=current_settings,
+        ))
+
+    with transaction.atomic():
+        PrecomputedRecommendation.objects.filter(college=college).delete()
+        PrecomputedRecommendation.objects.bulk_create(entries)
+    return len(entries)
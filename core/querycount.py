@@ -0,0 +1,163 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+_IN_LIST_RE = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+# Transaction bookkeeping is not a query anyone wrote, so it never counts as a repeat.
+_BOOKKEEPING = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def query_shape(sql):
+    """
+    Normalizes a SQL statement to its shape: parameters are already placeholders,
+    IN lists of any length collapse to `IN (...)` and whitespace is squashed.
+    """
+    return _WHITESPACE_RE.sub(' ', _IN_LIST_RE.sub('IN (...)', sql)).strip()
+
+
+class QueryCollector:
+    """
+    Records every query run on any database connection of the current thread.
+
+    Use it as a context manager, or call start() and stop() when the queries
+    to record outlive a single block (e.g. a streaming response).
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'duration': time.perf_counter() - started,
+            })
+
+    def start(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+            self._connections.append(connection)
+        return self
+
+    def stop(self):
+        for connection in self._connections:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+        self._connections = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def repeated(self, threshold):
+        """
+        Returns the query shapes executed at least `threshold` times, most frequent first.
+        A shape repeated once per row of a result is the signature of an N+1.
+        """
+        shapes = Counter(
+            query_shape(query['sql']) for query in self.queries
+            if not query['sql'].lstrip().upper().startswith(_BOOKKEEPING)
+        )
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def report(self, threshold):
+        """A readable summary: the total and every repeated shape."""
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f} ms"]
+        for shape, count in self.repeated(threshold):
+            lines.append(f"  {count}x {shape[:300]}")
+        return "\n".join(lines)
+
+class QueryCountMiddleware:
+    """
+    Counts the queries of every request (for development and staging).
+
+    Adds an X-Query-Count header and prints a warning when a request goes over
+    QUERY_COUNT_BUDGET queries or repeats a query shape QUERY_COUNT_REPEAT_THRESHOLD
+    times or more. Disabled unless QUERY_COUNT_ENABLED is set, in which case Django
+    drops it from the middleware chain at startup.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_COUNT_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector().start()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            collector.stop()
+            raise
+
+        if response.streaming:
+            # The body (and its queries) is produced after we return; report when it is exhausted.
+            response.streaming_content = self._streamed(request, response.streaming_content, collector)
+            return response
+
+        collector.stop()
+        response['X-Query-Count'] = str(collector.count)
+        self._warn(request, collector)
+        return response
+
+    def _streamed(self, request, content, collector):
+        try:
+            yield from content
+        finally:
+            collector.stop()
+            self._warn(request, collector)
+
+    def _warn(self, request, collector):
+        threshold = settings.QUERY_COUNT_REPEAT_THRESHOLD
+        over_budget = collector.count > settings.QUERY_COUNT_BUDGET
+        if over_budget or collector.repeated(threshold):
+            reason = "over budget" if over_budget else "possible N+1"
+            print(f"Query count {reason} for {request.method} {request.path}: {collector.report(threshold)}")
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that fails a test when a block runs too many queries or repeats
+    a query shape (an N+1).
+    """
+
+    repeat_threshold = 3
+
+    @contextmanager
+    def assertQueryBudget(self, budget, repeat_threshold=None):
+        """
+        Args:
+            budget (int): Maximum number of queries the block may run.
+            repeat_threshold (int): Fail when any query shape runs this many times.
+
+        Yields:
+            QueryCollector: The collector, e.g. to compare counts across data scales.
+        """
+        threshold = repeat_threshold or self.repeat_threshold
+        with QueryCollector() as collector:
+            yield collector
+        if collector.count > budget:
+            self.fail(f"Query budget of {budget} exceeded: {collector.report(threshold)}")
+        repeated = collector.repeated(threshold)
+        if repeated:
+            self.fail(f"Repeated query shapes (possible N+1): {collector.report(threshold)}")
@@ -0,0 +1,244 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import RateLimitBucket, LLMQueueEntry
+
+GLOBAL_KEY = 'global'
+# Poll intervals without a heartbeat after which a queue entry is treated as abandoned.
+# Waiters sleep at most four poll intervals between beats.
+HEARTBEAT_POLLS = 12
+
+
+class LLMUnavailable(Exception):
+    """
+    Raised when an LLM call cannot be made in time: no budget, or the provider kept throttling.
+    Callers must not treat the affected groups as having no recommendations.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimitTimeout(LLMUnavailable):
+    """Raised when an LLM call waited longer than LLM_MAX_QUEUE_WAIT (or its deadline) for rate-limit budget."""
+
+
+def college_key(college_id):
+    return f"college:{college_id}"
+
+def estimate_tokens(text):
+    """Rough token estimate for a prompt (about four characters per token) plus the expected output."""
+    return len(text) // 4 + settings.LLM_OUTPUT_TOKEN_ESTIMATE
+
+def _limits(key):
+    """Returns the (requests per minute, tokens per minute) budget for a bucket key. 0 means unlimited."""
+    if key == GLOBAL_KEY:
+        return settings.LLM_GLOBAL_REQUESTS_PER_MINUTE, settings.LLM_GLOBAL_TOKENS_PER_MINUTE
+    return settings.LLM_COLLEGE_REQUESTS_PER_MINUTE, settings.LLM_COLLEGE_TOKENS_PER_MINUTE
+
+def _enabled():
+    return any(_limits(GLOBAL_KEY)) or any(_limits('college'))
+
+def _refill(bucket, now):
+    """Adds the budget accrued since the last refill, capped at one minute's worth."""
+    rpm, tpm = _limits(bucket.key)
+    elapsed = max((now - bucket.refilled_at).total_seconds(), 0)
+    if rpm:
+        bucket.available_requests = min(rpm, bucket.available_requests + elapsed * rpm / 60)
+    if tpm:
+        bucket.available_tokens = min(tpm, bucket.available_tokens + elapsed * tpm / 60)
+    bucket.refilled_at = now
+
+def _seconds_until_available(bucket, tokens):
+    """Returns how long until `bucket` can grant one request of `tokens` tokens (0 if it can now)."""
+    rpm, tpm = _limits(bucket.key)
+    wait = 0
+    if rpm and bucket.available_requests < 1:
+        wait = (1 - bucket.available_requests) * 60 / rpm
+    if tpm:
+        # A single call larger than the whole bucket is let through once the bucket is full.
+        needed = min(tokens, tpm)
+        if bucket.available_tokens < needed:
+            wait = max(wait, (needed - bucket.available_tokens) * 60 / tpm)
+    return wait
+
+def _locked_bucket(key, college_id=None):
+    rpm, tpm = _limits(key)
+    bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+        key=key,
+        defaults={
+            'college_id': college_id,
+            'available_requests': rpm,
+            'available_tokens': tpm,
+            'refilled_at': timezone.now(),
+        },
+    )
+    return bucket
+
+def _stale_cutoff(now):
+    """Entries whose heartbeat is older than this belong to workers that died while waiting."""
+    return now - timedelta(seconds=settings.LLM_QUEUE_POLL_INTERVAL * HEARTBEAT_POLLS)
+
+def _heartbeat(entry):
+    """Marks a waiting entry as alive, re-queueing it if it was already dropped as abandoned."""
+    if not LLMQueueEntry.objects.filter(pk=entry.pk).update(heartbeat_at=timezone.now()):
+        entry.pk = None
+        entry.save()
+
+def _next_in_line(now):
+    """
+    Picks the queue entry that should be served next.
+
+    Only the oldest entry of each college is a candidate, and colleges whose own
+    budget is exhausted are skipped so they cannot block everyone else. Entries
+    without a recent heartbeat are ignored: a killed worker never dequeues itself. Among the
+    remaining candidates the college served least recently goes first, which
+    shares the global budget fairly between colleges during enrollment spikes.
+    """
+    heads = {}
+    entries = (
+        LLMQueueEntry.objects.filter(heartbeat_at__gte=_stale_cutoff(now))
+        .order_by('created_at', 'pk')
+        .values_list('pk', 'college_id', 'estimated_tokens')
+    )
+    for position, (pk, college_id, tokens) in enumerate(entries):
+        heads.setdefault(college_id, (position, pk, tokens))
+
+    buckets = {
+        bucket.college_id: bucket
+        for bucket in RateLimitBucket.objects.filter(key__in=[college_key(cid) for cid in heads])
+    }
+    never = datetime.min.replace(tzinfo=dt_timezone.utc)
+    candidates = []
+    for college_id, (position, pk, tokens) in heads.items():
+        bucket = buckets.get(college_id)
+        if bucket is not None:
+            _refill(bucket, now)
+            if _seconds_until_available(bucket, tokens) > 0:
+                continue
+        last_granted = bucket.last_granted_at if bucket and bucket.last_granted_at else never
+        candidates.append((last_granted, position, pk))
+    return min(candidates)[2] if candidates else None
+
+def _try_acquire(entry):
+    """
+    Attempts to grant budget to a queued entry.
+
+    Returns:
+        float: 0 when granted, otherwise the number of seconds to wait before retrying.
+    """
+    with transaction.atomic():
+        # Lock rows in a fixed order so concurrent workers cannot deadlock.
+        global_bucket = _locked_bucket(GLOBAL_KEY)
+        bucket = _locked_bucket(college_key(entry.college_id), entry.college_id)
+        now = timezone.now()
+
+        if _next_in_line(now) != entry.pk:
+            return settings.LLM_QUEUE_POLL_INTERVAL
+
+        _refill(global_bucket, now)
+        _refill(bucket, now)
+        wait = max(
+            _seconds_until_available(global_bucket, entry.estimated_tokens),
+            _seconds_until_available(bucket, entry.estimated_tokens),
+        )
+        if wait > 0:
+            global_bucket.save()
+            bucket.save()
+            return wait
+
+        waited = (now - entry.created_at).total_seconds()
+        for b in (global_bucket, bucket):
+            b.available_requests -= 1
+            b.available_tokens -= entry.estimated_tokens
+            b.last_granted_at = now
+            b.granted_count += 1
+            b.total_wait_seconds += waited
+            b.max_wait_seconds = max(b.max_wait_seconds, waited)
+            if waited > settings.LLM_QUEUE_POLL_INTERVAL:
+                b.waited_count += 1
+            b.save()
+        return 0
+
+def acquire(college, estimated_tokens, deadline=None):
+    """
+    Blocks until the global and per-college budgets allow one LLM call.
+
+    Calls are queued in the database so every worker process shares the same
+    budgets and the same fair ordering.
+
+    Args:
+        college (College): The college the call is made for.
+        estimated_tokens (int): Estimated prompt + output tokens of the call.
+        deadline (float): Optional time.monotonic() value the wait must not go past.
+
+    Returns:
+        float: Seconds spent waiting in the queue.
+
+    Raises:
+        RateLimitTimeout: If the call could not be scheduled within LLM_MAX_QUEUE_WAIT
+            seconds or before the deadline.
+    """
+    if not _enabled():
+        return 0.0
+
+    started = time.monotonic()
+    max_wait = settings.LLM_MAX_QUEUE_WAIT
+    if deadline is not None:
+        max_wait = min(max_wait, deadline - started)
+    LLMQueueEntry.objects.filter(heartbeat_at__lt=_stale_cutoff(timezone.now())).delete()
+    entry = LLMQueueEntry.objects.create(college=college, estimated_tokens=estimated_tokens)
+    try:
+        while True:
+            wait = _try_acquire(entry)
+            if not wait:
+                return time.monotonic() - started
+            if time.monotonic() - started + wait > max_wait:
+                raise RateLimitTimeout(
+                    f"Waited {time.monotonic() - started:.1f}s for LLM budget for college '{college.name}'.",
+                    retry_after=wait,
+                )
+            time.sleep(min(wait, settings.LLM_QUEUE_POLL_INTERVAL * 4))
+            _heartbeat(entry)
+    finally:
+        entry.delete()
+
+def settle(college, estimated_tokens, actual_tokens):
+    """Corrects both token buckets once the provider reports the real token usage of a call."""
+    if not _enabled() or actual_tokens is None:
+        return
+    difference = estimated_tokens - actual_tokens
+    if difference:
+        RateLimitBucket.objects.filter(key__in=[GLOBAL_KEY, college_key(college.pk)]).update(
+            available_tokens=F('available_tokens') + difference
+        )
+
+def queue_metrics():
+    """
+    Returns queue wait metrics and remaining budget for every bucket, plus the current queue depth.
+    """
+    now = timezone.now()
+    depth = dict(
+        LLMQueueEntry.objects.filter(heartbeat_at__gte=_stale_cutoff(now))
+        .values('college_id').annotate(n=Count('pk')).values_list('college_id', 'n')
+    )
+    buckets = []
+    for bucket in RateLimitBucket.objects.select_related('college').order_by('key'):
+        _refill(bucket, now)
+        buckets.append({
+            'key': bucket.key,
+            'college_name': bucket.college.name if bucket.college else None,
+            'available_requests': round(bucket.available_requests, 2),
+            'available_tokens': round(bucket.available_tokens),
+            'granted': bucket.granted_count,
+            'waited': bucket.waited_count,
+            'avg_wait_seconds': round(bucket.total_wait_seconds / bucket.granted_count, 3) if bucket.granted_count else 0,
+            'max_wait_seconds': round(bucket.max_wait_seconds, 3),
+            'queued': depth.get(bucket.college_id, 0) if bucket.college_id else sum(depth.values()),
+        })
+    return buckets
@@ -0,0 +1,89 @@
+import contextvars
+import hashlib
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'pin_primary'
+
+_reporting_reads = contextvars.ContextVar('reporting_reads', default=False)
+
+
+def replica_enabled():
+    return settings.REPLICA_DATABASE in settings.DATABASES
+
+class ReportingReplicaRouter:
+    """
+    Sends reads made inside `reporting_reads()` to the read replica, and everything
+    else (all writes included) to the primary database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _reporting_reads.get() and replica_enabled():
+            return settings.REPLICA_DATABASE
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so instances loaded from the replica are still saved to the primary.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, settings.REPLICA_DATABASE}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica follows the primary; it is never migrated directly.
+        return db != settings.REPLICA_DATABASE
+
+@contextmanager
+def reporting_reads(enabled=True):
+    """Routes the ORM reads made inside the block to the read replica (when one is configured)."""
+    token = _reporting_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _reporting_reads.reset(token)
+
+def _student_pin_key(college_name, student_id):
+    digest = hashlib.sha256(f"{college_name}\0{student_id}".encode()).hexdigest()
+    return f"replica-pin:{digest}"
+
+def pin_student_to_primary(college_name, student_id):
+    """
+    Keeps reads for a student on the primary for REPLICA_PIN_SECONDS after a write,
+    so they see their own submission despite replica lag.
+    """
+    if replica_enabled():
+        cache.set(_student_pin_key(college_name, student_id), True, settings.REPLICA_PIN_SECONDS)
+
+def pin_client_to_primary(response):
+    """Sets a short-lived cookie that keeps every read of the writing client on the primary."""
+    if replica_enabled():
+        response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+    return response
+
+def is_student_pinned(college_name, student_id):
+    return replica_enabled() and bool(cache.get(_student_pin_key(college_name, student_id)))
+
+def reporting_view(view):
+    """
+    Runs a read-only view against the read replica.
+
+    Only GET/HEAD requests are routed, and clients that wrote within the last
+    REPLICA_PIN_SECONDS (pin cookie) keep reading from the primary. Template
+    responses are rendered inside the block so lazy querysets use the replica too.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        enabled = request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES
+        with reporting_reads(enabled):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                response.render()
+        return response
+    return wrapped
@@ -19,13 +19,23 @@ class QuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = ['question_id', 'text', 'options']
 
+class SurveyQuestionSerializer(serializers.Serializer):
+    """
+    Validates one question of a bulk survey import.
+    Uses the same shape as the questions API so an export can be imported as-is.
+    """
+    question_id = serializers.CharField(max_length=50)
+    text = serializers.CharField()
+    options = OptionSerializer(many=True, required=False, default=list)
+
 class StudentSerializer(serializers.ModelSerializer):
     college_name = serializers.CharField(write_only=True)
+    recommendations = serializers.SerializerMethodField()
 
     class Meta:
         model = Student
         fields = ['student_id', 'name', 'department', 'semester', 'college', 'college_name', 'responses', 'recommendations', 'created_at']
-        read_only_fields = ['college', 'recommendations', 'created_at']
+        read_only_fields = ['college', 'created_at']
         
     def validate(self, data):
         """
@@ -52,13 +62,20 @@ class StudentSerializer(serializers.ModelSerializer):
         student = Student.objects.create(college=college, **validated_data)
         return student
 
+    def get_recommendations(self, obj):
+        return obj.get_recommendations()
+
 class StudentRecommendationSerializer(serializers.ModelSerializer):
     college = CollegeSerializer(read_only=True)
+    recommendations = serializers.SerializerMethodField()
     
     class Meta:
         model = Student
         fields = ['student_id', 'name', 'department', 'semester', 'college', 'recommendations']
 
+    def get_recommendations(self, obj):
+        return obj.get_recommendations()
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
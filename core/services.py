@@ -1,17 +1,86 @@
-import google.generativeai as genai
 from django.conf import settings
 import json
-from .models import Question, Option, RecommendationSetting, Student
+import time
+import requests
+from .models import RecommendationSetting, Student
+from .surveys import get_answer_schema
+from .ratelimit import LLMUnavailable, acquire, settle, estimate_tokens
 
 def initialize_gemini():
-    """Configures and returns a Gemini generative model instance."""
+    """
+    Configures and returns a Gemini generative model instance.
+
+    The SDK (and the grpc/protobuf stack under it) is imported here rather than at
+    module load, so worker boot, management commands and tests only pay for it
+    when a recommendation is actually generated.
+    """
+    import google.generativeai as genai
+
     genai.configure(api_key=settings.GEMINI_API_KEY)
     return genai.GenerativeModel('models/gemini-1.5-flash')
 
+def fetch_available_courses(college):
+    """
+    Fetches the course catalogue from the college's external API.
+
+    Raises:
+        requests.exceptions.RequestException: If the college API cannot be reached or errors.
+    """
+    response = requests.get(f"{college.base_url}/website/ReadCourseDetails")
+    response.raise_for_status()
+    return response.json()
+
+def generate_content(model, prompt, college, deadline=None):
+    """
+    Sends a prompt to the model through the shared rate limiter.
+
+    Waits in the cross-worker queue for global and per-college budget before each
+    attempt, and retries with exponential backoff when the provider still throttles
+    (HTTP 429) instead of failing the call.
+
+    Args:
+        model: The generative model instance.
+        prompt (str): The prompt to send.
+        college (College): The college the call is made for (used for its budget).
+        deadline (float): Optional time.monotonic() value by which waiting and retrying must stop.
+
+    Returns:
+        The model response.
+
+    Raises:
+        LLMUnavailable: If no budget was granted in time, or the provider still throttled
+            after LLM_MAX_RETRIES retries or once the deadline would be exceeded.
+    """
+    from google.api_core import exceptions as google_exceptions
+
+    estimated = estimate_tokens(prompt)
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise LLMUnavailable(f"No time left to call the LLM for college '{college.name}'.")
+        acquire(college, estimated, deadline)
+        try:
+            response = model.generate_content(prompt)
+        except google_exceptions.ResourceExhausted as e:
+            backoff = settings.LLM_RETRY_BACKOFF * 2 ** attempt
+            out_of_time = deadline is not None and time.monotonic() + backoff >= deadline
+            if attempt == settings.LLM_MAX_RETRIES or out_of_time:
+                raise LLMUnavailable(
+                    f"LLM provider kept throttling calls for college '{college.name}': {e}", retry_after=backoff
+                ) from e
+            print(f"LLM provider throttled a call for college '{college.name}', retrying in {backoff}s: {e}")
+            time.sleep(backoff)
+            continue
+
+        usage = getattr(response, 'usage_metadata', None)
+        settle(college, estimated, getattr(usage, 'total_token_count', None))
+        return response
+
 def map_option_values_to_text(student):
     """
     Converts student's selected option values into human-readable text,
     ensuring questions are matched within the student's college.
+
+    Uses the college's cached AnswerSchema, so no per-answer queries are made.
     
     Args:
         student (Student): The student instance, containing responses and college info.
@@ -19,73 +88,56 @@ def map_option_values_to_text(student):
     Returns:
         dict: A dictionary with question text as keys and the corresponding selected option text as values.
     """
-    enriched = {}
     if not student.responses:
-        return enriched
+        return {}
+    return get_answer_schema(student.college).describe(student.responses)
 
-    for qid, selected_value in student.responses.items():
-        try:
-            # FIX: Look up the question using both its ID and the student's college
-            # to prevent mismatching questions from different colleges.
-            question = Question.objects.get(question_id=qid, college=student.college)
-            option = question.option_set.get(value=selected_value)
-            enriched[question.text] = option.text
-        except (Question.DoesNotExist, Option.DoesNotExist):
-            enriched[f"Question ID {qid} for college {student.college.name}"] = f"Selected: {selected_value} (question or option not found)"
-    return enriched
-
-def generate_course_recommendations(student, available_courses):
+def group_courses_for_student(student, available_courses):
     """
-    Generates course recommendations using the Gemini model based on student survey responses.
-    
-    Args:
-        student (Student): The student instance for whom recommendations are being generated.
-        available_courses (list): A list of all available courses from the college.
+    Groups the available courses by SubjectGroupName, keeps those of the student's
+    semester and attaches each group's configured number of recommendations.
+
+    Groups without courses for the semester or without a RecommendationSetting are skipped.
 
     Returns:
-        dict: A dictionary containing a list of final course recommendations.
+        list: (group_name, courses, num_recommendations) tuples in catalogue order.
     """
-    college = student.college
-    student_semester = student.semester
-
-    # FIX: Pass the entire student object to the mapping function.
-    enriched_responses = map_option_values_to_text(student)
-
     # First, group all available courses by SubjectGroupName
     grouped_courses = {}
     for course in available_courses:
         group = course.get('SubjectGroupName', 'Unknown')
         grouped_courses.setdefault(group, []).append(course)
 
-    final_recommendations = []
+    # One query for every group's setting instead of one per group
+    num_by_group = dict(
+        RecommendationSetting.objects.filter(college=student.college)
+        .values_list('subject_group_name', 'num_recommendations')
+    )
 
-    # Process each subject group separately
+    groups = []
     for group_name, courses_in_group in grouped_courses.items():
-        
         # Then, filter the courses within that group by SemesterName
         filtered_courses_for_semester = courses_in_group
-        if student_semester:
+        if student.semester:
             filtered_courses_for_semester = [
-                c for c in courses_in_group if c.get('SemesterName', '').lower() == student_semester.lower()
+                c for c in courses_in_group if c.get('SemesterName', '').lower() == student.semester.lower()
             ]
 
-        if not filtered_courses_for_semester:
+        if not filtered_courses_for_semester or group_name not in num_by_group:
             continue
+        groups.append((group_name, filtered_courses_for_semester, num_by_group[group_name]))
+    return groups
 
-        try:
-            setting = RecommendationSetting.objects.get(college=college, subject_group_name=group_name)
-            num_recommend = setting.num_recommendations
-        except RecommendationSetting.DoesNotExist:
-            continue
-
-        prompt = f"""
+def build_group_prompt(group_name, courses, num_recommend, enriched_responses):
+    """Builds the prompt asking for recommendations within a single subject group."""
+    return f"""
 You are an expert academic advisor. Based on the student's survey responses and the list of available courses for the "{group_name}" subject group, recommend exactly {num_recommend} of the most suitable courses.
 
 **Student Responses:**
 {json.dumps(enriched_responses, indent=2)}
 
 **Available {group_name} Courses (for the student's semester):**
-{json.dumps(filtered_courses_for_semester, indent=2)}
+{json.dumps(courses, indent=2)}
 
 **Instructions:**
 - Analyze the student's preferences.
@@ -99,19 +151,186 @@ You are an expert academic advisor. Based on the student's survey responses and
   ]
 }}
 """
-        try:
-            model = initialize_gemini()
-            response = model.generate_content(prompt)
-            cleaned_response = response.text.strip().replace('```json', '').replace('```', '')
-            parsed_json = json.loads(cleaned_response)
-            
-            if 'recommendations' in parsed_json:
-                for rec in parsed_json['recommendations']:
-                    rec['SubjectGroupName'] = group_name
-                final_recommendations.extend(parsed_json['recommendations'])
-
-        except Exception as e:
-            print(f"An error occurred while generating recommendations for group '{group_name}': {e}")
-            continue
 
-    return {"recommendations": final_recommendations}
\ No newline at end of file
+def build_batch_prompt(groups, enriched_responses):
+    """
+    Builds one prompt covering several subject groups.
+    The student responses are sent once and the model answers with a JSON object keyed by group name.
+    """
+    group_specs = {
+        group_name: {"num_recommendations": num_recommend, "courses": courses}
+        for group_name, courses, num_recommend in groups
+    }
+    return f"""
+You are an expert academic advisor. Based on the student's survey responses, recommend the most suitable courses for each of the subject groups below. Each group lists its available courses (for the student's semester) and how many courses to recommend from it.
+
+**Student Responses:**
+{json.dumps(enriched_responses, indent=2)}
+
+**Subject Groups:**
+{json.dumps(group_specs, separators=(',', ':'))}
+
+**Instructions:**
+- Analyze the student's preferences.
+- For every subject group, return exactly its "num_recommendations" courses, chosen only from that group's own course list.
+- Your response must be only a JSON object keyed by subject group name in the following format:
+{{
+  "recommendations": {{
+    "<SubjectGroupName>": [
+      {{"SubjectName": "...", "PaperName": "..."}},
+      ...
+    ],
+    ...
+  }}
+}}
+"""
+
+def split_into_batches(groups, token_budget):
+    """
+    Packs subject groups into batches whose course lists fit in `token_budget` estimated tokens.
+    A group larger than the budget on its own gets a batch to itself.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for group in groups:
+        group_tokens = len(json.dumps(group[1], separators=(',', ':'))) // 4
+        if current and current_tokens + group_tokens > token_budget:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(group)
+        current_tokens += group_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_model_json(response):
+    """Strips Markdown code fences from a model response and parses it as JSON."""
+    cleaned_response = response.text.strip().replace('```json', '').replace('```', '')
+    return json.loads(cleaned_response)
+
+def _valid_recommendations(recommendations):
+    """
+    Keeps the well-formed entries of a model's list of recommendations.
+
+    Returns:
+        list: The dict entries that name a SubjectName and PaperName, or None when
+            `recommendations` is not a list or has no such entry.
+    """
+    if not isinstance(recommendations, list):
+        return None
+    valid = [rec for rec in recommendations if isinstance(rec, dict) and 'SubjectName' in rec and 'PaperName' in rec]
+    return valid or None
+
+def _recommend_group(model, college, group, enriched_responses, deadline=None):
+    group_name, courses, num_recommend = group
+    prompt = build_group_prompt(group_name, courses, num_recommend, enriched_responses)
+    try:
+        parsed_json = parse_model_json(generate_content(model, prompt, college, deadline))
+        recommendations = parsed_json.get('recommendations', [])
+        for rec in recommendations:
+            rec['SubjectGroupName'] = group_name
+        return recommendations
+    except LLMUnavailable:
+        # Not a bad answer: the group was never generated, so the submission must not look complete
+        raise
+    except Exception as e:
+        print(f"An error occurred while generating recommendations for group '{group_name}': {e}")
+        return []
+
+def _recommend_batch(model, college, batch, enriched_responses, deadline=None):
+    """
+    Returns {group_name: recommendations} for a batch of groups using one prompt.
+    Groups missing from the model's answer, or answered with no well-formed
+    recommendation, fall back to a per-group prompt.
+    """
+    if len(batch) == 1:
+        return {batch[0][0]: _recommend_group(model, college, batch[0], enriched_responses, deadline)}
+
+    keyed = {}
+    try:
+        prompt = build_batch_prompt(batch, enriched_responses)
+        parsed_json = parse_model_json(generate_content(model, prompt, college, deadline))
+        keyed = parsed_json.get('recommendations', {})
+        if not isinstance(keyed, dict):
+            keyed = {}
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        print(f"An error occurred while generating recommendations for groups {[g[0] for g in batch]}: {e}")
+
+    results = {}
+    for group in batch:
+        group_name = group[0]
+        recommendations = _valid_recommendations(keyed.get(group_name))
+        if recommendations is not None:
+            results[group_name] = [dict(rec, SubjectGroupName=group_name) for rec in recommendations]
+        else:
+            results[group_name] = _recommend_group(model, college, group, enriched_responses, deadline)
+    return results
+
+def iter_course_recommendations(student, available_courses):
+    """
+    Generates course recommendations group by group, yielding each subject group's
+    recommendations as soon as they are ready.
+
+    By default each subject group is sent as its own prompt. With LLM_BATCH_GROUPS enabled,
+    groups are packed into as few prompts as LLM_BATCH_TOKEN_BUDGET allows, so the student's
+    responses are sent once per batch instead of once per group; the groups of a batch are
+    yielded together when the batch finishes. Groups larger than COURSE_SHORTLIST_SIZE are
+    first trimmed to the courses most similar to the student's answers.
+
+    All waiting for rate-limit budget and provider retries shares one deadline of
+    LLM_SUBMISSION_TIMEOUT seconds, which is kept below the gunicorn worker timeout.
+
+    Args:
+        student (Student): The student instance for whom recommendations are being generated.
+        available_courses (list): A list of all available courses from the college.
+
+    Yields:
+        tuple: (group_name, recommendations) for every eligible subject group, in catalogue order.
+
+    Raises:
+        LLMUnavailable: If a group could not be generated in time. Groups already yielded
+            are then only a partial result and must not be saved as final.
+    """
+    college = student.college
+    deadline = time.monotonic() + settings.LLM_SUBMISSION_TIMEOUT
+
+    # FIX: Pass the entire student object to the mapping function.
+    enriched_responses = map_option_values_to_text(student)
+    groups = group_courses_for_student(student, available_courses)
+    if not groups:
+        return
+    # Imported here so NumPy is only loaded when recommendations are generated
+    from .embeddings import shortlist_groups
+    groups = shortlist_groups(student, groups, enriched_responses)
+    model = initialize_gemini()
+
+    if settings.LLM_BATCH_GROUPS:
+        for batch in split_into_batches(groups, settings.LLM_BATCH_TOKEN_BUDGET):
+            results = _recommend_batch(model, college, batch, enriched_responses, deadline)
+            for group_name, _, _ in batch:
+                yield group_name, results[group_name]
+    else:
+        # Process each subject group separately
+        for group in groups:
+            yield group[0], _recommend_group(model, college, group, enriched_responses, deadline)
+
+def generate_course_recommendations(student, available_courses):
+    """
+    Generates course recommendations using the Gemini model based on student survey responses.
+    
+    Args:
+        student (Student): The student instance for whom recommendations are being generated.
+        available_courses (list): A list of all available courses from the college.
+
+    Returns:
+        dict: A dictionary containing a list of final course recommendations.
+
+    Raises:
+        LLMUnavailable: If any subject group could not be generated in time.
+    """
+    final_recommendations = []
+    for _, recommendations in iter_course_recommendations(student, available_courses):
+        final_recommendations.extend(recommendations)
+    return {"recommendations": final_recommendations}
@@ -0,0 +1,149 @@
+import csv
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import College, Question, Option, PrecomputedRecommendation
+from .serializers import QuestionSerializer
+from .validation import AnswerSchema
+
+CSV_FIELDS = ['question_id', 'question_text', 'option_text', 'option_value']
+
+
+def _question_cache_key(college):
+    return f"college-questions:{college.pk}:v{college.survey_version}"
+
+def get_question_payload(college):
+    """
+    Returns the serialized questions (with options) for a college, served from cache when possible.
+
+    Args:
+        college (College): The college whose survey is requested.
+
+    Returns:
+        list: The same payload returned by the questions API.
+    """
+    key = _question_cache_key(college)
+    payload = cache.get(key)
+    if payload is None:
+        questions = Question.objects.filter(college=college).prefetch_related('option_set').order_by('id')
+        payload = QuestionSerializer(questions, many=True).data
+        cache.set(key, payload, settings.QUESTION_CACHE_TIMEOUT)
+    return payload
+
+def _answer_schema_cache_key(college):
+    return f"college-answer-schema:{college.pk}:v{college.survey_version}"
+
+def get_answer_schema(college):
+    """
+    Returns the college's compiled AnswerSchema, served from cache when possible.
+
+    The schema is built from the cached question payload, so validating a
+    submission needs no queries once the cache is warm. Cache keys carry the
+    college's survey_version, so a worker that loaded the college after a survey
+    change never validates against the previous survey.
+    """
+    key = _answer_schema_cache_key(college)
+    schema = cache.get(key)
+    if schema is None:
+        schema = AnswerSchema(get_question_payload(college))
+        cache.set(key, schema, settings.QUESTION_CACHE_TIMEOUT)
+    return schema
+
+def invalidate_question_cache(college):
+    """
+    Bumps the college's survey_version, which retires its cached question payload
+    and answer schema in every worker, not just the current process.
+    """
+    College.objects.filter(pk=college.pk).update(survey_version=F('survey_version') + 1)
+    college.refresh_from_db(fields=['survey_version'])
+
+def parse_survey_csv(text):
+    """
+    Parses a CSV survey with one row per option into the JSON import format.
+
+    Expected columns: question_id, question_text, option_text, option_value.
+    A question without options can be given as a single row with empty option columns.
+
+    Returns:
+        list: A list of {"question_id", "text", "options"} dictionaries.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    missing = set(CSV_FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {sorted(missing)}")
+
+    questions = {}
+    for row in reader:
+        qid = (row['question_id'] or '').strip()
+        if not qid:
+            continue
+        question = questions.setdefault(qid, {'question_id': qid, 'text': row['question_text'], 'options': []})
+        if row['option_value']:
+            question['options'].append({'text': row['option_text'], 'value': row['option_value']})
+    return list(questions.values())
+
+def import_survey(college, questions, replace=False):
+    """
+    Upserts a college's whole survey in a single transaction.
+
+    Questions are upserted with one bulk INSERT ... ON CONFLICT on (college, question_id);
+    the options of every imported question are replaced with the ones given.
+
+    Args:
+        college (College): The college the survey belongs to.
+        questions (list): Validated {"question_id", "text", "options"} dictionaries.
+        replace (bool): Also delete existing questions that are not part of the import.
+
+    Returns:
+        dict: Counts of imported questions, imported options and deleted questions.
+    """
+    question_ids = [q['question_id'] for q in questions]
+    if len(set(question_ids)) != len(question_ids):
+        raise ValueError("Duplicate question_id values in import.")
+
+    deleted = 0
+    with transaction.atomic():
+        Question.objects.bulk_create(
+            [Question(college=college, question_id=q['question_id'], text=q['text']) for q in questions],
+            update_conflicts=True,
+            unique_fields=['college', 'question_id'],
+            update_fields=['text'],
+        )
+        pks = dict(
+            Question.objects.filter(college=college, question_id__in=question_ids).values_list('question_id', 'pk')
+        )
+        Option.objects.filter(question_id__in=pks.values()).delete()
+        options = Option.objects.bulk_create([
+            Option(question_id=pks[q['question_id']], text=opt['text'], value=opt['value'])
+            for q in questions for opt in q.get('options', [])
+        ])
+        if replace:
+            deleted, _ = Question.objects.filter(college=college).exclude(question_id__in=question_ids).delete()
+        invalidate_question_cache(college)
+        PrecomputedRecommendation.objects.filter(college=college).delete()
+
+    return {'questions': len(questions), 'options': len(options), 'deleted': deleted}
+
+def export_survey(college):
+    """Returns a college's survey in the JSON import format."""
+    return list(get_question_payload(college))
+
+def survey_to_csv(questions):
+    """Renders a survey in the JSON import format as CSV text (one row per option)."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for question in questions:
+        options = question.get('options') or [{'text': '', 'value': ''}]
+        for option in options:
+            writer.writerow({
+                'question_id': question['question_id'],
+                'question_text': question['text'],
+                'option_text': option['text'],
+                'option_value': option['value'],
+            })
+    return output.getvalue()
@@ -1,3 +1,893 @@
-from django.test import TestCase
+import importlib
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import _apply_delta, rebuild_college_stats, record_submission, top_recommended_courses
+from .catalogue import affected_students, catalogue_hash, diff_catalogues, latest_snapshot, record_catalogue
+from .embeddings import _matrix_cache, catalogue_vectors, shortlist_groups
+from .management.commands.bench_startup import BOOT_SNIPPET, LAZY_MODULES, parse_importtime
+from .models import (
+    AnswerStat, CatalogueSnapshot, College, CollegeUser, LLMQueueEntry, Option, PrecomputedRecommendation, Question,
+    RateLimitBucket, RecommendationSetting, Student, pack_recommendations, unpack_recommendations,
+)
+from .precompute import frequent_profiles, lookup_precomputed, precompute_college, profile_hash, settings_hash
+from .querycount import QueryBudgetMixin, QueryCollector, query_shape
+from .ratelimit import LLMUnavailable, RateLimitTimeout, _next_in_line, _refill, acquire, college_key
+from .routers import (
+    PIN_COOKIE, ReportingReplicaRouter, is_student_pinned, pin_client_to_primary, pin_student_to_primary, reporting_reads,
+    reporting_view,
+)
+from .services import _recommend_batch, generate_content, split_into_batches
+from .surveys import get_answer_schema, import_survey, parse_survey_csv, survey_to_csv
+from .urls import urlpatterns
+from .validation import AnswerSchema
+
+SEMESTER = 'Semester 1'
+GROUPS = ('Core', 'Elective')
+
+
+def make_courses(per_group=5):
+    return [
+        {'SubjectGroupName': group, 'SemesterName': SEMESTER, 'SubjectName': f'{group} {i}', 'PaperName': f'Paper {i}'}
+        for group in GROUPS for i in range(per_group)
+    ]
+
+class FakeCatalogueResponse:
+    def __init__(self, courses):
+        self.courses = courses
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.courses
+
+class FakeModel:
+    """Answers every prompt with the same two courses, like a (very confident) Gemini."""
+
+    def generate_content(self, prompt):
+        text = json.dumps({'recommendations': [
+            {'SubjectName': 'Core 0', 'PaperName': 'Paper 0'},
+            {'SubjectName': 'Core 1', 'PaperName': 'Paper 1'},
+        ]})
+        return mock.Mock(text=text, usage_metadata=None)
+
+
+def make_college(name='Test College', **kwargs):
+    return College.objects.create(college_id=name.upper().replace(' ', '-'), name=name, base_url='http://catalogue.test', **kwargs)
+
+
+class AnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.college = make_college()
+
+    def counts(self):
+        return dict(AnswerStat.objects.filter(college=self.college).values_list('value', 'count'))
+
+    def test_positive_delta_creates_then_increments_rows(self):
+        _apply_delta(AnswerStat, self.college, ('question_id', 'value'), Counter({('Q1', 'A'): 2, ('Q1', 'B'): 1}))
+        _apply_delta(AnswerStat, self.college, ('question_id', 'value'), Counter({('Q1', 'A'): 1, ('Q1', 'C'): 1}))
+        self.assertEqual(self.counts(), {'A': 3, 'B': 1, 'C': 1})
+
+    def test_negative_delta_decrements_and_never_goes_below_zero(self):
+        _apply_delta(AnswerStat, self.college, ('question_id', 'value'), Counter({('Q1', 'A'): 2, ('Q1', 'B'): 1}))
+        _apply_delta(AnswerStat, self.college, ('question_id', 'value'), {('Q1', 'A'): -1, ('Q1', 'B'): -5, ('Q1', 'Z'): -1})
+        self.assertEqual(self.counts(), {'A': 1, 'B': 0})
+
+    def test_resubmission_moves_counts_between_answers(self):
+        student = Student.objects.create(college=self.college, student_id='S1', name='A', department='CS', semester='S1',
+                                         responses={'Q1': 'A'})
+        record_submission(student)
+        previous = student.responses
+        student.responses = {'Q1': 'B'}
+        student.set_recommendations([{'SubjectName': 'AI', 'PaperName': 'ML', 'SubjectGroupName': 'Core'}])
+        record_submission(student, previous, [])
+        self.assertEqual(self.counts(), {'A': 0, 'B': 1})
+        self.assertEqual(
+            top_recommended_courses(self.college),
+            [{'subject_group_name': 'Core', 'semester': 'S1', 'courses': [{'SubjectName': 'AI', 'PaperName': 'ML', 'count': 1}]}],
+        )
+
+    def test_analytics_endpoints_are_admin_only(self):
+        for name in ('answer-analytics', 'course-analytics'):
+            url = reverse(name, args=[self.college.name])
+            self.client.logout()
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.client.force_login(User.objects.create_user(f'staff-{name}', is_staff=False))
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.client.force_login(User.objects.create_user(f'admin-{name}', is_staff=True))
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_rebuild_matches_incremental_counts(self):
+        for i, value in enumerate('AAB'):
+            Student.objects.create(college=self.college, student_id=f'S{i}', name='A', department='CS', responses={'Q1': value})
+        rebuild_college_stats(self.college)
+        self.assertEqual(self.counts(), {'A': 2, 'B': 1})
+
+
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class AdminChangelistTests(TestCase):
+    """Changelists must not query per row (e.g. through __str__ of a related college)."""
+
+    MODELS = ('college', 'question', 'student', 'recommendationsetting', 'cataloguesnapshot', 'collegeuser')
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', password='pass')
+        self.client.force_login(self.admin)
+
+    def seed(self, count):
+        for i in range(count):
+            college = make_college(f'College {count}-{i}')
+            question = Question.objects.create(college=college, question_id='Q1', text='Question')
+            Option.objects.create(question=question, text='Yes', value='A')
+            Student.objects.create(college=college, student_id='S1', name='A', department='CS', responses={'Q1': 'A'})
+            RecommendationSetting.objects.create(college=college, subject_group_name='Core', num_recommendations=2)
+            CatalogueSnapshot.objects.create(college=college, version=1, content_hash='x', courses=[], checked_at=timezone.now())
+            CollegeUser.objects.create(user=User.objects.create_user(f'user{count}-{i}'), college=college)
+
+    def changelist_queries(self, model):
+        with QueryCollector() as collector:
+            response = self.client.get(reverse(f'admin:core_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return collector.count
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.seed(2)
+        small = {model: self.changelist_queries(model) for model in self.MODELS}
+        self.seed(10)
+        for model in self.MODELS:
+            with self.subTest(model=model):
+                self.assertEqual(self.changelist_queries(model), small[model])
+
+    def test_college_change_page_links_to_students_instead_of_inlining_them(self):
+        self.seed(1)
+        college = College.objects.get()
+        response = self.client.get(reverse('admin:core_college_change', args=[college.pk]))
+        self.assertContains(response, 'View 1 registered students')
+        self.assertNotContains(response, 'student_set-TOTAL_FORMS')
+
+
+class SurveyImportTests(TestCase):
+
+    def setUp(self):
+        self.college = make_college()
+
+    def survey(self):
+        return {
+            q.question_id: (q.text, sorted(q.option_set.values_list('value', 'text')))
+            for q in Question.objects.filter(college=self.college).prefetch_related('option_set')
+        }
+
+    def test_import_upserts_questions_and_replaces_their_options(self):
+        import_survey(self.college, [
+            {'question_id': 'Q1', 'text': 'Old', 'options': [{'text': 'Yes', 'value': 'A'}, {'text': 'No', 'value': 'B'}]},
+            {'question_id': 'Q2', 'text': 'Kept', 'options': []},
+        ])
+        result = import_survey(self.college, [
+            {'question_id': 'Q1', 'text': 'New', 'options': [{'text': 'Maybe', 'value': 'C'}]},
+        ])
+        self.assertEqual(result, {'questions': 1, 'options': 1, 'deleted': 0})
+        self.assertEqual(self.survey(), {'Q1': ('New', [('C', 'Maybe')]), 'Q2': ('Kept', [])})
+
+    def test_replace_deletes_questions_missing_from_the_import(self):
+        import_survey(self.college, [{'question_id': 'Q1', 'text': 'One'}, {'question_id': 'Q2', 'text': 'Two'}])
+        result = import_survey(self.college, [{'question_id': 'Q2', 'text': 'Two'}], replace=True)
+        self.assertEqual(result['deleted'], 1)
+        self.assertEqual(list(self.survey()), ['Q2'])
+
+    def test_duplicate_question_ids_are_rejected(self):
+        with self.assertRaises(ValueError):
+            import_survey(self.college, [{'question_id': 'Q1', 'text': 'A'}, {'question_id': 'Q1', 'text': 'B'}])
+
+    def test_csv_round_trip(self):
+        questions = [
+            {'question_id': 'Q1', 'text': 'Pick, one', 'options': [{'text': 'Yes', 'value': 'A'}, {'text': 'No', 'value': 'B'}]},
+            {'question_id': 'Q2', 'text': 'Free text', 'options': []},
+        ]
+        self.assertEqual(parse_survey_csv(survey_to_csv(questions)), questions)
+
+    def test_csv_without_required_columns_is_rejected(self):
+        with self.assertRaises(ValueError):
+            parse_survey_csv('question_id,question_text\nQ1,Hello\n')
+
+
+class CompactRecommendationTests(TestCase):
+
+    RECOMMENDATIONS = [
+        {'SubjectName': 'AI', 'PaperName': 'ML', 'SubjectGroupName': 'Core'},
+        {'SubjectName': 'Art', 'PaperName': 'Drawing', 'SubjectGroupName': 'Elective', 'Reason': 'Creative'},
+        {'SubjectName': 'DB', 'PaperName': 'SQL', 'SubjectGroupName': 'Core'},
+    ]
+
+    def test_round_trip_groups_by_subject_group_and_keeps_extra_keys(self):
+        packed = pack_recommendations(self.RECOMMENDATIONS)
+        self.assertEqual(packed, {'v': 1, 'groups': [
+            ['Core', [['AI', 'ML'], ['DB', 'SQL']]],
+            ['Elective', [['Art', 'Drawing', {'Reason': 'Creative'}]]],
+        ]})
+        self.assertCountEqual(unpack_recommendations(packed), self.RECOMMENDATIONS)
+
+    def test_legacy_lists_and_none_pass_through(self):
+        self.assertEqual(unpack_recommendations(self.RECOMMENDATIONS), self.RECOMMENDATIONS)
+        self.assertIsNone(unpack_recommendations(None))
+        self.assertIsNone(pack_recommendations(None))
+
+    def test_student_reads_both_storage_forms(self):
+        college = make_college()
+        legacy = Student.objects.create(college=college, student_id='S1', name='A', department='CS',
+                                        recommendations=self.RECOMMENDATIONS)
+        compact = Student(college=college, student_id='S2', name='B', department='CS')
+        compact.set_recommendations(self.RECOMMENDATIONS)
+        compact.save()
+        self.assertIsInstance(Student.objects.with_survey_data().get(pk=compact.pk).recommendations, dict)
+        for student in Student.objects.with_survey_data().filter(pk__in=[legacy.pk, compact.pk]):
+            self.assertCountEqual(student.get_recommendations(), self.RECOMMENDATIONS)
+
+    def test_migration_packs_legacy_rows_and_reverses(self):
+        migration = importlib.import_module('core.migrations.0012_compact_student_recommendations')
+        student = Student.objects.create(college=make_college(), student_id='S1', name='A', department='CS',
+                                         recommendations=self.RECOMMENDATIONS)
+        migration.pack_existing(django_apps, None)
+        packed = Student.objects.with_survey_data().get(pk=student.pk).recommendations
+        self.assertEqual(packed, pack_recommendations(self.RECOMMENDATIONS))
+        migration.unpack_existing(django_apps, None)
+        self.assertCountEqual(Student.objects.with_survey_data().get(pk=student.pk).recommendations, self.RECOMMENDATIONS)
+
+
+class StudentManagerTests(TestCase):
+
+    def setUp(self):
+        Student.objects.create(college=make_college(), student_id='S1', name='A', department='CS',
+                               responses={'Q1': 'A'}, recommendations=[])
+
+    def test_survey_json_is_deferred_by_default(self):
+        self.assertEqual(Student.objects.get().get_deferred_fields(), {'responses', 'recommendations'})
+
+    def test_with_survey_data_loads_all_or_some_fields(self):
+        self.assertEqual(Student.objects.with_survey_data().get().get_deferred_fields(), set())
+        self.assertEqual(Student.objects.with_survey_data('responses').get().get_deferred_fields(), {'recommendations'})
+
+
+@override_settings(
+    LLM_GLOBAL_REQUESTS_PER_MINUTE=0, LLM_GLOBAL_TOKENS_PER_MINUTE=0,
+    LLM_COLLEGE_REQUESTS_PER_MINUTE=30, LLM_COLLEGE_TOKENS_PER_MINUTE=600,
+    LLM_MAX_RETRIES=2, LLM_RETRY_BACKOFF=0, LLM_OUTPUT_TOKEN_ESTIMATE=0,
+)
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        self.first, self.second = make_college('First College'), make_college('Second College')
+
+    def bucket(self, college, requests=30, tokens=600, refilled_ago=0, granted_ago=None):
+        now = timezone.now()
+        return RateLimitBucket.objects.create(
+            key=college_key(college.pk), college=college, available_requests=requests, available_tokens=tokens,
+            refilled_at=now - timedelta(seconds=refilled_ago),
+            last_granted_at=None if granted_ago is None else now - timedelta(seconds=granted_ago),
+        )
+
+    def test_refill_accrues_budget_and_caps_at_one_minute(self):
+        bucket = self.bucket(self.first, requests=0, tokens=0, refilled_ago=30)
+        _refill(bucket, timezone.now())
+        self.assertAlmostEqual(bucket.available_requests, 15, places=0)
+        self.assertAlmostEqual(bucket.available_tokens, 300, places=0)
+
+        _refill(bucket, bucket.refilled_at + timedelta(minutes=10))
+        self.assertEqual((bucket.available_requests, bucket.available_tokens), (30, 600))
+
+    def test_least_recently_served_college_goes_next(self):
+        self.bucket(self.first, granted_ago=1)
+        self.bucket(self.second, granted_ago=60)
+        LLMQueueEntry.objects.create(college=self.first, estimated_tokens=10)
+        second_entry = LLMQueueEntry.objects.create(college=self.second, estimated_tokens=10)
+        self.assertEqual(_next_in_line(timezone.now()), second_entry.pk)
+
+    def test_exhausted_college_does_not_block_others(self):
+        self.bucket(self.first, requests=0)
+        self.bucket(self.second, granted_ago=1)
+        LLMQueueEntry.objects.create(college=self.first, estimated_tokens=10)
+        second_entry = LLMQueueEntry.objects.create(college=self.second, estimated_tokens=10)
+        self.assertEqual(_next_in_line(timezone.now()), second_entry.pk)
+
+    def test_orphaned_entry_of_a_killed_worker_does_not_block_other_colleges(self):
+        self.bucket(self.first)
+        self.bucket(self.second, granted_ago=1)
+        orphan = LLMQueueEntry.objects.create(college=self.first, estimated_tokens=10)
+        LLMQueueEntry.objects.filter(pk=orphan.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=10))
+
+        acquire(self.second, 10, deadline=time.monotonic() + 2)
+        self.assertFalse(LLMQueueEntry.objects.filter(pk=orphan.pk).exists())
+
+    def test_acquire_gives_up_at_the_deadline(self):
+        self.bucket(self.first, requests=0)
+        with self.assertRaises(RateLimitTimeout) as raised:
+            acquire(self.first, 10, deadline=time.monotonic() + 0.1)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertFalse(LLMQueueEntry.objects.exists())
+
+    def test_provider_throttling_becomes_llm_unavailable(self):
+        from google.api_core.exceptions import ResourceExhausted
+
+        model = mock.Mock()
+        model.generate_content.side_effect = ResourceExhausted('quota')
+        with self.assertRaises(LLMUnavailable):
+            generate_content(model, 'prompt', self.first)
+        self.assertEqual(model.generate_content.call_count, 3)
+
+    def test_no_retry_once_the_deadline_has_passed(self):
+        model = mock.Mock()
+        with self.assertRaises(LLMUnavailable):
+            generate_content(model, 'prompt', self.first, deadline=time.monotonic() - 1)
+        model.generate_content.assert_not_called()
+
+@override_settings(LLM_BATCH_GROUPS=False, COURSE_SHORTLIST_SIZE=0)
+class LLMUnavailableSubmissionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.college = make_college()
+        for group in GROUPS:
+            RecommendationSetting.objects.create(college=self.college, subject_group_name=group, num_recommendations=2)
+        self.student = Student.objects.create(
+            college=self.college, student_id='S1', name='A', department='CS', semester=SEMESTER
+        )
+        question = Question.objects.create(college=self.college, question_id='Q1', text='Question 1')
+        Option.objects.create(question=question, text='Yes', value='A')
+        self.payload = {'student_id': 'S1', 'college_name': self.college.name, 'answers': {'Q1': 'A'}}
+        responses = [FakeModel().generate_content(''), LLMUnavailable('busy', retry_after=4.2)]
+        patches = [
+            mock.patch('core.services.requests.get', return_value=FakeCatalogueResponse(make_courses())),
+            mock.patch('core.services.initialize_gemini', return_value=FakeModel()),
+            # The first group succeeds, the second one runs out of budget
+            mock.patch('core.services.generate_content', side_effect=responses),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, name):
+        return self.client.post(reverse(name), json.dumps(self.payload), content_type='application/json')
+
+    def test_submit_answers_is_503_and_saves_nothing(self):
+        response = self.post('submit-answers')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.student.refresh_from_db()
+        self.assertIsNone(self.student.get_recommendations())
+
+    def test_stream_ends_with_retryable_error_and_saves_nothing(self):
+        response = self.post('submit-answers-stream')
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([event['event'] for event in events], ['group', 'error'])
+        self.assertEqual(events[-1]['retry_after'], 5)
+        self.student.refresh_from_db()
+        self.assertIsNone(self.student.get_recommendations())
+
+
+class BatchRecommendationTests(TestCase):
+
+    def setUp(self):
+        self.college = make_college()
+        self.batch = [('Core', make_courses()[:5], 2), ('Elective', make_courses()[5:], 2)]
+
+    def model_answering(self, *answers):
+        model = mock.Mock()
+        model.generate_content.side_effect = [mock.Mock(text=json.dumps(a), usage_metadata=None) for a in answers]
+        return model
+
+    def test_split_into_batches_respects_the_token_budget(self):
+        groups = [(f'G{i}', [{'SubjectName': 'x' * 36}], 1) for i in range(5)]  # 14 tokens each
+        self.assertEqual([len(batch) for batch in split_into_batches(groups, 30)], [2, 2, 1])
+        self.assertEqual([len(batch) for batch in split_into_batches(groups, 1000)], [5])
+
+    def test_group_larger_than_the_budget_gets_its_own_batch(self):
+        groups = [('Small', [{'SubjectName': 'x'}], 1), ('Huge', [{'SubjectName': 'x' * 400}], 1), ('Small 2', [], 1)]
+        self.assertEqual([[g[0] for g in batch] for batch in split_into_batches(groups, 20)],
+                         [['Small'], ['Huge'], ['Small 2']])
+
+    def test_keyed_answer_is_split_by_group(self):
+        model = self.model_answering({'recommendations': {
+            'Core': [{'SubjectName': 'Core 0', 'PaperName': 'Paper 0'}],
+            'Elective': [{'SubjectName': 'Elective 1', 'PaperName': 'Paper 1'}],
+        }})
+        results = _recommend_batch(model, self.college, self.batch, {})
+        self.assertEqual(results['Elective'], [{'SubjectName': 'Elective 1', 'PaperName': 'Paper 1', 'SubjectGroupName': 'Elective'}])
+        self.assertEqual(model.generate_content.call_count, 1)
+
+    def test_malformed_group_answers_fall_back_to_a_group_prompt(self):
+        fallback = {'recommendations': [{'SubjectName': 'Elective 2', 'PaperName': 'Paper 2'}]}
+        model = self.model_answering(
+            {'recommendations': {
+                'Core': ['Course X', {'SubjectName': 'Core 0', 'PaperName': 'Paper 0'}, {'SubjectName': 'No paper'}],
+                'Elective': ['Course Y'],
+            }},
+            fallback,
+        )
+        results = _recommend_batch(model, self.college, self.batch, {})
+        self.assertEqual(results['Core'], [{'SubjectName': 'Core 0', 'PaperName': 'Paper 0', 'SubjectGroupName': 'Core'}])
+        self.assertEqual(results['Elective'], [{'SubjectName': 'Elective 2', 'PaperName': 'Paper 2', 'SubjectGroupName': 'Elective'}])
+        self.assertEqual(model.generate_content.call_count, 2)
+
+    def test_non_dict_answer_falls_back_for_every_group(self):
+        group_answer = {'recommendations': [{'SubjectName': 'S', 'PaperName': 'P'}]}
+        model = self.model_answering({'recommendations': ['Course X']}, group_answer, group_answer)
+        results = _recommend_batch(model, self.college, self.batch, {})
+        self.assertEqual(sorted(results), ['Core', 'Elective'])
+        self.assertEqual(model.generate_content.call_count, 3)
+
+
+class PrecomputeTests(TestCase):
+
+    def setUp(self):
+        self.college = make_college()
+        for group in GROUPS:
+            RecommendationSetting.objects.create(college=self.college, subject_group_name=group, num_recommendations=2)
+        self.courses = make_courses()
+        self.recommendations = [{'SubjectName': 'Core 0', 'PaperName': 'Paper 0', 'SubjectGroupName': 'Core'}]
+
+    def store(self, responses, **kwargs):
+        fields = {
+            'college': self.college, 'semester': SEMESTER.lower(), 'profile_hash': profile_hash(responses),
+            'responses': responses, 'recommendations': pack_recommendations(self.recommendations),
+            'catalogue_hash': catalogue_hash(self.courses), 'settings_hash': settings_hash(self.college),
+        }
+        fields.update(kwargs)
+        return PrecomputedRecommendation.objects.create(**fields)
+
+    def student(self, responses):
+        return Student(college=self.college, semester=SEMESTER, responses=responses)
+
+    def test_profile_hash_ignores_key_order_and_value_types(self):
+        self.assertEqual(profile_hash({'Q2': 'B', 'Q1': 1}), profile_hash({'Q1': '1', 'Q2': 'B'}))
+        self.assertNotEqual(profile_hash({'Q1': 'A'}), profile_hash({'Q1': 'B'}))
+
+    def test_lookup_hit_returns_recommendations_and_counts_the_hit(self):
+        entry = self.store({'Q1': 'A'})
+        self.assertEqual(lookup_precomputed(self.student({'Q1': 'A'}), self.courses), self.recommendations)
+        entry.refresh_from_db()
+        self.assertEqual(entry.hit_count, 1)
+
+    def test_lookup_misses_on_other_answers_catalogue_or_settings(self):
+        self.store({'Q1': 'A'})
+        self.assertIsNone(lookup_precomputed(self.student({'Q1': 'B'}), self.courses))
+        self.assertIsNone(lookup_precomputed(self.student({'Q1': 'A'}), self.courses[:-1]))
+        RecommendationSetting.objects.filter(college=self.college, subject_group_name='Core').update(num_recommendations=3)
+        self.assertIsNone(lookup_precomputed(self.student({'Q1': 'A'}), self.courses))
+
+    def test_frequent_profiles_counts_normalized_answers(self):
+        for i, responses in enumerate([{'Q1': 'A'}, {'Q1': 'A'}, {'Q1': 'B'}, None]):
+            Student.objects.create(college=self.college, student_id=f'S{i}', name='N', department='CS', semester=SEMESTER,
+                                   responses=responses)
+        self.assertEqual(frequent_profiles(self.college), [(SEMESTER.lower(), {'Q1': 'A'}, 2)])
+        self.assertEqual(len(frequent_profiles(self.college, min_students=1)), 2)
+
+    def test_precompute_college_replaces_entries(self):
+        question = Question.objects.create(college=self.college, question_id='Q1', text='Question 1')
+        Option.objects.create(question=question, text='Yes', value='A')
+        for i in range(2):
+            Student.objects.create(college=self.college, student_id=f'S{i}', name='N', department='CS', semester=SEMESTER,
+                                   responses={'Q1': 'A'})
+        self.store({'Q1': 'stale'})
+        with mock.patch('core.precompute.fetch_available_courses', return_value=self.courses), \
+                mock.patch('core.precompute.generate_course_recommendations',
+                           return_value={'recommendations': self.recommendations}):
+            self.assertEqual(precompute_college(self.college), 1)
+            self.assertIsNone(precompute_college(self.college, only_if_changed=True))
+        self.assertEqual(lookup_precomputed(self.student({'Q1': 'A'}), self.courses), self.recommendations)
+        self.assertEqual(PrecomputedRecommendation.objects.count(), 1)
+
+
+class CatalogueTests(TestCase):
+
+    def setUp(self):
+        self.college = make_college()
+        self.courses = make_courses(per_group=2)
+
+    def test_diff_reports_added_removed_and_changed_courses_per_scope(self):
+        new = [dict(course) for course in self.courses if course['SubjectName'] != 'Core 0']
+        new[0]['Credits'] = 4  # Core 1
+        new.append({'SubjectGroupName': 'Elective', 'SemesterName': 'Semester 2', 'SubjectName': 'New', 'PaperName': 'P'})
+        self.assertEqual(diff_catalogues(self.courses, new), [
+            {'subject_group_name': 'Core', 'semester': SEMESTER, 'added': [],
+             'removed': [{'SubjectName': 'Core 0', 'PaperName': 'Paper 0'}],
+             'changed': [{'SubjectName': 'Core 1', 'PaperName': 'Paper 1'}]},
+            {'subject_group_name': 'Elective', 'semester': 'Semester 2',
+             'added': [{'SubjectName': 'New', 'PaperName': 'P'}], 'removed': [], 'changed': []},
+        ])
+        self.assertEqual(diff_catalogues(self.courses, list(reversed(self.courses))), [])
+
+    def test_new_version_only_for_changed_content(self):
+        first = record_catalogue(self.college, self.courses)
+        self.assertEqual(record_catalogue(self.college, list(reversed(self.courses))).pk, first.pk)
+        second = record_catalogue(self.college, self.courses[1:])
+        self.assertEqual((second.version, len(second.diff)), (2, 1))
+
+    def test_unchanged_feed_touches_checked_at_at_most_once_per_interval(self):
+        snapshot = record_catalogue(self.college, self.courses)
+        with self.assertNumQueries(1):
+            record_catalogue(self.college, self.courses)
+
+        CatalogueSnapshot.objects.filter(pk=snapshot.pk).update(checked_at=timezone.now() - timedelta(hours=1))
+        with self.assertNumQueries(2):
+            record_catalogue(self.college, self.courses)
+        self.assertGreater(CatalogueSnapshot.objects.get(pk=snapshot.pk).checked_at, timezone.now() - timedelta(minutes=1))
+
+    def test_latest_snapshot_defers_the_course_list(self):
+        record_catalogue(self.college, self.courses)
+        self.assertIn('courses', latest_snapshot(self.college).get_deferred_fields())
+
+    def test_affected_students_are_older_and_in_a_touched_semester(self):
+        record_catalogue(self.college, self.courses)
+        students = {}
+        for student_id, semester, version in [
+            ('old', SEMESTER, 1), ('unversioned', SEMESTER, None), ('other-semester', 'Semester 2', 1),
+            ('no-semester', '', 1), ('current', SEMESTER, 2),
+        ]:
+            students[student_id] = Student.objects.create(
+                college=self.college, student_id=student_id, name='N', department='CS', semester=semester,
+                catalogue_version=version, recommendations=pack_recommendations([{'SubjectName': 'Core 0'}]),
+            )
+        Student.objects.create(college=self.college, student_id='never-submitted', name='N', department='CS',
+                               semester=SEMESTER)
+        snapshot = record_catalogue(self.college, self.courses[1:])
+        self.assertEqual(
+            set(affected_students(snapshot).values_list('student_id', flat=True)),
+            {'old', 'unversioned', 'no-semester'},
+        )
+
+
+@override_settings(LLM_BATCH_GROUPS=False, COURSE_SHORTLIST_SIZE=0)
+class StreamSubmissionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.college = make_college()
+        for group in GROUPS:
+            RecommendationSetting.objects.create(college=self.college, subject_group_name=group, num_recommendations=2)
+        question = Question.objects.create(college=self.college, question_id='Q1', text='Question 1')
+        Option.objects.create(question=question, text='Yes', value='A')
+        self.student = Student.objects.create(
+            college=self.college, student_id='S1', name='A', department='CS', semester=SEMESTER
+        )
+        patches = [
+            mock.patch('core.services.requests.get', return_value=FakeCatalogueResponse(make_courses())),
+            mock.patch('core.services.initialize_gemini', return_value=FakeModel()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stream(self):
+        payload = {'student_id': 'S1', 'college_name': self.college.name, 'answers': {'Q1': 'A'}}
+        return self.client.post(reverse('submit-answers-stream'), json.dumps(payload), content_type='application/json')
+
+    def test_streams_one_event_per_group_then_saves(self):
+        events = [json.loads(line) for line in b''.join(self.stream().streaming_content).splitlines()]
+        self.assertEqual([event['event'] for event in events], ['group', 'group', 'done'])
+        self.assertEqual([event['SubjectGroupName'] for event in events[:2]], list(GROUPS))
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.get_recommendations(), events[-1]['recommendations'])
+
+    def test_disconnected_client_still_gets_every_group_saved(self):
+        response = self.stream()
+        content = iter(response.streaming_content)
+        next(content)
+        response.close()  # What the WSGI server does when the client goes away
+
+        self.student.refresh_from_db()
+        saved_groups = {rec['SubjectGroupName'] for rec in self.student.get_recommendations()}
+        self.assertEqual(saved_groups, set(GROUPS))
+
+
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('core.routers.replica_enabled', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReportingReplicaRouter()
+
+    def test_only_reporting_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Student), 'default')
+        with reporting_reads():
+            self.assertEqual(self.router.db_for_read(Student), settings.REPLICA_DATABASE)
+            self.assertEqual(self.router.db_for_write(Student), 'default')
+
+    def test_reporting_view_routes_only_unpinned_gets(self):
+        seen = []
+        view = reporting_view(lambda request: seen.append(self.router.db_for_read(Student)) or HttpResponse())
+        factory = RequestFactory()
+        pinned = factory.get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        for request in (factory.get('/'), factory.post('/'), pinned):
+            view(request)
+        self.assertEqual(seen, [settings.REPLICA_DATABASE, 'default', 'default'])
+
+    def test_student_pin_is_per_student(self):
+        pin_student_to_primary('Test College', 'S1')
+        self.assertTrue(is_student_pinned('Test College', 'S1'))
+        self.assertFalse(is_student_pinned('Test College', 'S2'))
+        self.assertFalse(is_student_pinned('Other College', 'S1'))
+
+    def test_submitting_client_gets_the_pin_cookie(self):
+        response = pin_client_to_primary(HttpResponse())
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+
+class StartupTests(TestCase):
+
+    def test_parse_importtime_reads_rows_and_nesting(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   _io\n"
+            "import time:        80 |        300 |     encodings.utf_8\n"
+            "import time:      1500 |       2000 | django\n"
+            "some warning on stderr\n"
+        )
+        self.assertEqual(parse_importtime(stderr), [
+            ('_io', 120, 120, 1), ('encodings.utf_8', 80, 300, 2), ('django', 1500, 2000, 0),
+        ])
+
+    def test_worker_boot_does_not_import_the_llm_sdk(self):
+        check = "\nimport sys\nprint(','.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+        result = subprocess.run([sys.executable, '-c', BOOT_SNIPPET + check], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class AnswerSchemaTests(TestCase):
+
+    def setUp(self):
+        self.schema = AnswerSchema([
+            {'question_id': 'Q1', 'text': 'Favourite subject?', 'options': [{'text': 'Maths', 'value': 'A'}, {'text': 'Art', 'value': 2}]},
+            {'question_id': 2, 'text': 'Anything else?', 'options': []},
+        ])
+
+    def test_valid_answers_are_normalized_to_strings(self):
+        self.assertEqual(self.schema.validate({'Q1': ' 2 ', 2: 'Robots'}), ({'Q1': '2', '2': 'Robots'}, {}))
+
+    def test_invalid_answers_are_reported_per_question(self):
+        normalized, errors = self.schema.validate({'Q1': 'Z', '2': '', 'Q9': 'A', 'Q1 ': ['A']})
+        self.assertEqual(normalized, {})
+        self.assertEqual(set(errors), {'Q1', '2', 'Q9', 'Q1 '})
+        self.assertIn("expected one of ['2', 'A']", errors['Q1'])
+        self.assertEqual(self.schema.validate(['A']), ({}, {'answers': mock.ANY}))
+
+    def test_describe_maps_values_to_text(self):
+        self.assertEqual(self.schema.describe({'Q1': 'A', '2': 'Robots'}),
+                         {'Favourite subject?': 'Maths', 'Anything else?': 'Robots'})
+
+    def test_survey_change_is_seen_by_workers_with_a_warm_cache(self):
+        cache.clear()
+        college = make_college()
+        import_survey(college, [{'question_id': 'Q1', 'text': 'Q?', 'options': [{'text': 'Yes', 'value': 'A'}]}])
+        worker_college = College.objects.get(pk=college.pk)
+        self.assertTrue(get_answer_schema(worker_college).validate({'Q1': 'B'})[1])
+
+        # Another worker edits the survey; this worker's cached schema for the old version stays put
+        import_survey(College.objects.get(pk=college.pk), [
+            {'question_id': 'Q1', 'text': 'Q?', 'options': [{'text': 'Yes', 'value': 'A'}, {'text': 'No', 'value': 'B'}]}
+        ])
+        self.assertTrue(get_answer_schema(worker_college).validate({'Q1': 'B'})[1])
+
+        next_request_college = College.objects.get(pk=college.pk)
+        self.assertEqual(get_answer_schema(next_request_college).validate({'Q1': 'B'}), ({'Q1': 'B'}, {}))
+
+
+@override_settings(COURSE_SHORTLIST_SIZE=2, COURSE_SHORTLIST_MIN_SCORE=0.1,
+                   COURSE_EMBEDDER='core.embeddings.HashingEmbedder')
+class ShortlistTests(TestCase):
+
+    def setUp(self):
+        names = ['Machine Learning', 'Pottery', 'Dance', 'Deep Learning', 'Poetry', 'Sculpture']
+        self.courses = [
+            {'SubjectGroupName': 'Core', 'SemesterName': SEMESTER, 'SubjectName': name, 'PaperName': f'Paper {i}'}
+            for i, name in enumerate(names)
+        ]
+        self.student = Student(semester=SEMESTER)
+
+    def shortlist(self, answer, num_recommend=1):
+        groups = shortlist_groups(self.student, [('Core', self.courses, num_recommend)], {'What interests you?': answer})
+        return [course['SubjectName'] for course in groups[0][1]]
+
+    def test_keeps_the_most_similar_courses_in_catalogue_order(self):
+        self.assertEqual(self.shortlist('deep learning and machine learning'), ['Machine Learning', 'Deep Learning'])
+
+    def test_unrelated_answers_keep_the_whole_group(self):
+        self.assertEqual(len(self.shortlist('swimming')), len(self.courses))
+        # Only one course is related, but two would be kept: the second pick would be arbitrary
+        self.assertEqual(len(self.shortlist('dance')), len(self.courses))
+
+    def test_groups_are_never_cut_below_the_recommendation_count(self):
+        self.assertEqual(len(self.shortlist('deep learning and machine learning', num_recommend=6)), len(self.courses))
+
+    def test_matrix_cache_evicts_oldest_version_when_full(self):
+        college = make_college()
+        for version in range(3):
+            record_catalogue(college, self.courses[version:])
+        with mock.patch('core.embeddings.MATRIX_CACHE_SIZE', 2), mock.patch.dict(_matrix_cache, clear=True):
+            for version in (1, 2, 3, 3):
+                matrix, index = catalogue_vectors(college.pk, version)
+                self.assertEqual(matrix.shape[0], len(self.courses) - version + 1)
+            self.assertEqual([key[1] for key in _matrix_cache], [2, 3])
+
+    @override_settings(COURSE_SHORTLIST_SIZE=0)
+    def test_off_when_size_is_zero(self):
+        self.assertEqual(len(self.shortlist('deep learning and machine learning')), len(self.courses))
+
+
+class QueryShapeTests(TestCase):
+
+    def test_in_lists_of_any_length_share_a_shape(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            query_shape('SELECT *  FROM t\nWHERE id IN (%s)'),
+        )
+
+    def test_collector_flags_repeated_shapes(self):
+        College.objects.create(college_id='C1', name='One', base_url='http://one.test')
+        with QueryCollector() as collector:
+            for _ in range(3):
+                list(College.objects.filter(name='One'))
+        self.assertEqual(collector.count, 3)
+        self.assertEqual(len(collector.repeated(3)), 1)
+        self.assertEqual(collector.repeated(4), [])
+
+
+@override_settings(
+    STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'query-budget-tests'}},
+    LLM_BATCH_GROUPS=False,
+    COURSE_SHORTLIST_SIZE=0,
+)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Runs every endpoint of core/urls.py and the college panel against seeded data at
+    several scales. An endpoint fails when it goes over its query budget, repeats a
+    query shape (N+1), or runs more queries as the data grows.
+    """
+
+    SCALES = (1, 10, 40)
+
+    # Maximum queries per request, independent of the number of students, questions
+    # and options. The submit endpoints make one Gemini call per subject group, each
+    # going through the shared rate limiter (the first call also creates its buckets).
+    BUDGETS = {
+        'register-student': 6,
+        'college-questions': 3,
+        'submit-answers': 44,
+        'submit-answers-stream': 32,
+        'student-recommendation': 1,
+        'college-recommendations': 2,
+        'survey-import': 12,
+        'survey-export': 3,
+        'answer-analytics': 6,
+        'course-analytics': 4,
+        'llm-queue-metrics': 4,
+        'college-panel': 5,
+    }
+
+    # The rate limiter reads the global and the college bucket on every Gemini call,
+    # so those shapes repeat once per subject group rather than once per row.
+    REPEAT_THRESHOLDS = {
+        'submit-answers': 8,
+        'submit-answers-stream': 8,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.courses = make_courses()
+        patches = [
+            mock.patch('core.services.requests.get', return_value=FakeCatalogueResponse(self.courses)),
+            mock.patch('core.services.initialize_gemini', return_value=FakeModel()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def seed(self, scale):
+        college = College.objects.create(college_id=f'C{scale}', name=f'College {scale}', base_url='http://catalogue.test')
+        for group in GROUPS:
+            RecommendationSetting.objects.create(college=college, subject_group_name=group, num_recommendations=2)
+
+        questions = Question.objects.bulk_create([
+            Question(college=college, question_id=f'Q{i}', text=f'Question {i}') for i in range(scale)
+        ])
+        Option.objects.bulk_create([
+            Option(question=question, text=f'Option {value}', value=value)
+            for question in questions for value in 'ABC'
+        ])
+
+        answers = {f'Q{i}': 'ABC'[i % 3] for i in range(scale)}
+        recommendations = pack_recommendations([
+            {'SubjectName': f'{group} 0', 'PaperName': 'Paper 0', 'SubjectGroupName': group} for group in GROUPS
+        ])
+        Student.objects.bulk_create([
+            Student(
+                college=college, student_id=f'S{i}', name=f'Student {i}', department='CS', semester=SEMESTER,
+                responses=answers, recommendations=recommendations,
+            )
+            for i in range(scale)
+        ])
+        rebuild_college_stats(college)
+
+        admin = User.objects.create_user(f'admin{scale}', password='pass', is_staff=True)
+        staff = User.objects.create_user(f'staff{scale}', password='pass')
+        CollegeUser.objects.create(user=staff, college=college)
+        return college, answers, admin, staff
+
+    def requests_for(self, scale, college, answers):
+        """(url name, method, url, payload, login) for every endpoint at one scale."""
+        name = college.name
+        survey = [
+            {'question_id': f'Q{i}', 'text': f'Question {i}?', 'options': [{'text': 'Yes', 'value': 'A'}, {'text': 'No', 'value': 'B'}]}
+            for i in range(scale)
+        ]
+        submission = {'student_id': 'S0', 'college_name': name, 'answers': answers}
+        return [
+            ('register-student', 'post', reverse('register-student'),
+             {'student_id': 'NEW', 'name': 'New', 'department': 'CS', 'semester': SEMESTER, 'college_name': name}, None),
+            ('college-questions', 'get', reverse('college-questions', args=[name]), None, None),
+            ('submit-answers', 'post', reverse('submit-answers'), submission, None),
+            ('submit-answers-stream', 'post', reverse('submit-answers-stream'), submission, None),
+            ('student-recommendation', 'get', reverse('student-recommendation', args=['S0', name]), None, None),
+            ('college-recommendations', 'get', reverse('college-recommendations', args=[name]), None, None),
+            ('survey-export', 'get', reverse('survey-export', args=[name]), None, 'admin'),
+            ('survey-import', 'post', reverse('survey-import', args=[name]), survey, 'admin'),
+            ('answer-analytics', 'get', reverse('answer-analytics', args=[name]), None, 'admin'),
+            ('course-analytics', 'get', reverse('course-analytics', args=[name]), None, 'admin'),
+            ('llm-queue-metrics', 'get', reverse('llm-queue-metrics'), None, 'admin'),
+            ('college-panel', 'get', reverse('college-panel'), None, 'staff'),
+        ]
+
+    def call(self, method, url, payload):
+        if method == 'post':
+            return self.client.post(url, json.dumps(payload), content_type='application/json')
+        return self.client.get(url)
+
+    def test_every_endpoint_has_a_budget(self):
+        self.assertLessEqual({pattern.name for pattern in urlpatterns}, set(self.BUDGETS))
+
+    def test_endpoints_stay_within_budget_at_every_scale(self):
+        counts = {}
+        for scale in self.SCALES:
+            college, answers, admin, staff = self.seed(scale)
+            users = {'admin': admin, 'staff': staff}
+            for name, method, url, payload, login in self.requests_for(scale, college, answers):
+                with self.subTest(endpoint=name, scale=scale):
+                    self.client.logout()
+                    if login:
+                        self.client.force_login(users[login])
+                    with self.assertQueryBudget(self.BUDGETS[name], self.REPEAT_THRESHOLDS.get(name)) as collector:
+                        response = self.call(method, url, payload)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                    self.assertLess(response.status_code, 300, response.content if not response.streaming else '')
+                    counts.setdefault(name, {})[scale] = collector.count
+
+        smallest, largest = self.SCALES[0], self.SCALES[-1]
+        for name, by_scale in counts.items():
+            if smallest not in by_scale or largest not in by_scale:
+                continue  # Already reported as over budget above
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(
+                    by_scale[largest], by_scale[smallest],
+                    f"{name} runs more queries as data grows (queries per scale: {by_scale})"
+                )
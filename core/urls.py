@@ -6,6 +6,12 @@ urlpatterns = [
     path('register-student/', views.register_student, name='register-student'),
     path('questions/<str:college_name>/', views.get_college_questions, name='college-questions'),
     path('submit-answers/', views.submit_answers, name='submit-answers'),
+    path('submit-answers/stream/', views.submit_answers_stream, name='submit-answers-stream'),
     path('student-recommendation/<str:student_id>/<str:college_name>/', views.get_student_recommendation, name='student-recommendation'),
     path('college-recommendations/<str:college_name>/', views.get_college_recommendations, name='college-recommendations'),
+    path('survey/<str:college_name>/import/', views.import_college_survey, name='survey-import'),
+    path('survey/<str:college_name>/export/', views.export_college_survey, name='survey-export'),
+    path('analytics/answers/<str:college_name>/', views.get_answer_analytics, name='answer-analytics'),
+    path('analytics/courses/<str:college_name>/', views.get_course_analytics, name='course-analytics'),
+    path('metrics/llm-queue/', views.get_llm_queue_metrics, name='llm-queue-metrics'),
 ]
@@ -0,0 +1,85 @@
+class AnswerSchema:
+    """
+    Precompiled answer rules for one college's survey.
+
+    Maps each question id to the frozenset of its allowed option values, so a whole
+    submission is validated and normalized in one pass without touching the database.
+    Questions without options accept any non-empty text. Build it with
+    `core.surveys.get_answer_schema`, which caches it alongside the question payload.
+    """
+
+    def __init__(self, questions):
+        """
+        Args:
+            questions (list): The questions API payload ({"question_id", "text", "options"} dictionaries).
+        """
+        self.allowed = {}
+        self.question_text = {}
+        self.option_text = {}
+        for question in questions:
+            qid = str(question['question_id'])
+            options = question.get('options') or []
+            self.allowed[qid] = frozenset(str(option['value']) for option in options)
+            self.question_text[qid] = question['text']
+            for option in options:
+                self.option_text[(qid, str(option['value']))] = option['text']
+
+    def validate(self, answers):
+        """
+        Validates and normalizes one submission.
+
+        Args:
+            answers (dict): Question id -> selected option value, as submitted.
+
+        Returns:
+            tuple: (normalized, errors). `normalized` maps string question ids to string
+            values; `errors` maps each rejected question id to a message and is empty
+            when the submission is valid.
+        """
+        if not isinstance(answers, dict):
+            return {}, {'answers': "Answers must be an object mapping question IDs to option values."}
+
+        normalized, errors = {}, {}
+        for qid, value in answers.items():
+            qid = str(qid)
+            allowed = self.allowed.get(qid)
+            if allowed is None:
+                errors[qid] = "Unknown question for this college."
+                continue
+            if isinstance(value, (dict, list)) or value is None:
+                errors[qid] = "Answer must be a single option value."
+                continue
+            value = str(value).strip()
+            if allowed and value not in allowed:
+                errors[qid] = f"'{value}' is not an option of this question; expected one of {sorted(allowed)}."
+            elif not value:
+                errors[qid] = "Answer must not be empty."
+            else:
+                normalized[qid] = value
+        return normalized, errors
+
+    def validate_many(self, submissions):
+        """
+        Validates a batch of submissions against the same schema.
+
+        Returns:
+            list: One (normalized, errors) tuple per submission, in input order.
+        """
+        return [self.validate(answers) for answers in submissions]
+
+    def describe(self, responses):
+        """
+        Converts stored responses into {question text: option text} for prompts.
+
+        Responses that no longer match the survey (e.g. stored before it was edited)
+        are kept with a "not found" marker instead of being dropped.
+        """
+        enriched = {}
+        for qid, value in (responses or {}).items():
+            qid, value = str(qid), str(value)
+            allowed = self.allowed.get(qid)
+            if allowed is None or (allowed and value not in allowed):
+                enriched[f"Question ID {qid}"] = f"Selected: {value} (question or option not found)"
+            else:
+                enriched[self.question_text[qid]] = self.option_text.get((qid, value), value)
+        return enriched
@@ -1,18 +1,30 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
 
-from .models import College, Question, Student, CollegeUser
+from .models import College, Student, CollegeUser
 from .serializers import (
-    CollegeSerializer, QuestionSerializer, StudentSerializer,
-    CollegeUserSerializer, StudentRecommendationSerializer
+    CollegeSerializer, StudentSerializer,
+    CollegeUserSerializer, StudentRecommendationSerializer, SurveyQuestionSerializer
 )
 
+import json
+import math
 import requests
-from .services import generate_course_recommendations
+from .services import generate_course_recommendations, iter_course_recommendations, fetch_available_courses
+from .precompute import lookup_precomputed
+from .catalogue import record_catalogue
+from .analytics import record_submission, answer_distribution, top_recommended_courses
+from .ratelimit import LLMUnavailable, queue_metrics
+from .routers import (
+    PIN_COOKIE, reporting_view, reporting_reads, pin_student_to_primary, pin_client_to_primary, is_student_pinned
+)
+from .surveys import get_answer_schema, get_question_payload, import_survey, export_survey, parse_survey_csv, survey_to_csv
 
 
 # API: Register Student
@@ -22,6 +34,7 @@ def register_student(request):
     serializer = StudentSerializer(data=request.data)
     if serializer.is_valid():
         student = serializer.save()
+        record_submission(student)
         return Response({
             'message': 'Student registered successfully',
             'student_id': student.student_id
@@ -34,87 +47,214 @@ def register_student(request):
 @permission_classes([permissions.AllowAny])
 def get_college_questions(request, college_name):
     college = get_object_or_404(College, name=college_name)
-    questions = Question.objects.filter(college=college)
-    serializer = QuestionSerializer(questions, many=True)
-    return Response(serializer.data)
+    return Response(get_question_payload(college))
 
 
-# API: Submit student answers and get course recommendations
-@api_view(['POST'])
-@permission_classes([permissions.AllowAny])
-def submit_answers(request):
+def _prepare_submission(request):
+    """
+    Validates a submit-answers request, applies the new answers to the student and
+    fetches the college's course catalogue.
+
+    Returns:
+        tuple: (submission, None) on success, or (None, error Response).
+    """
     student_id = request.data.get('student_id')
     answers = request.data.get('answers')
     college_name = request.data.get('college_name')
 
     if not student_id or not answers or not college_name:
-        return Response(
+        return None, Response(
             {'error': 'student_id, answers, and college_name are required.'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
     # Fetch student and college
-    student = get_object_or_404(Student, student_id=student_id, college__name=college_name)
+    student = get_object_or_404(
+        Student.objects.with_survey_data().select_related('college'),
+        student_id=student_id, college__name=college_name
+    )
     college = student.college
 
-    # FIX: Validate that the questions submitted belong to the student's college
-    valid_question_ids = set(Question.objects.filter(college=college).values_list('question_id', flat=True))
-    submitted_question_ids = set(answers.keys())
-
-    if not submitted_question_ids.issubset(valid_question_ids):
-        invalid_ids = submitted_question_ids - valid_question_ids
-        return Response(
-            {'error': f"The following question IDs do not belong to college '{college_name}': {list(invalid_ids)}"},
+    # Validate and normalize every answer against the college's compiled survey schema
+    # before any upstream or LLM work is done.
+    answers, invalid_answers = get_answer_schema(college).validate(answers)
+    if invalid_answers:
+        return None, Response(
+            {
+                'error': f"Some answers are not valid for college '{college_name}'.",
+                'invalid_answers': invalid_answers,
+            },
             status=status.HTTP_400_BAD_REQUEST
         )
-    
+
+    submission = {
+        'student': student,
+        'previous_responses': student.responses,
+        'previous_recommendations': student.get_recommendations(),
+    }
     student.responses = answers
 
     # Fetch available courses from external college API
     try:
-        response = requests.get(f"{student.college.base_url}/website/ReadCourseDetails")
-        response.raise_for_status()
-        available_courses = response.json()
+        submission['available_courses'] = fetch_available_courses(college)
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch courses: {e}")
-        return Response(
+        return None, Response(
             {'error': 'Failed to fetch course list from the college. Please try again later.'},
             status=status.HTTP_502_BAD_GATEWAY
         )
 
-    # Get recommendations from Gemini (pass the full student object)
-    recommendations_data = generate_course_recommendations(student, available_courses)
+    # Detect catalogue changes and remember which version these recommendations are based on
+    snapshot = record_catalogue(college, submission['available_courses'])
+    student.catalogue_version = snapshot.version
+    return submission, None
 
-    # Save final recommendations
-    student.recommendations = recommendations_data.get('recommendations', [])
+
+def _retry_after(error):
+    """Seconds a client should wait before resubmitting after an LLMUnavailable error."""
+    return max(1, math.ceil(error.retry_after or settings.LLM_RETRY_BACKOFF))
+
+
+def _save_submission(submission, recommendations):
+    """Persists the final recommendations and refreshes the analytics summary tables."""
+    student = submission['student']
+    student.set_recommendations(recommendations)
     student.save()
+    record_submission(student, submission['previous_responses'], submission['previous_recommendations'])
+    pin_student_to_primary(student.college.name, student.student_id)
 
-    return Response(recommendations_data, status=status.HTTP_200_OK)
+
+# API: Submit student answers and get course recommendations
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def submit_answers(request):
+    submission, error = _prepare_submission(request)
+    if error:
+        return error
+    student, available_courses = submission['student'], submission['available_courses']
+
+    # Use recommendations precomputed for this answer profile when available,
+    # otherwise get them from Gemini (pass the full student object)
+    precomputed = lookup_precomputed(student, available_courses)
+    if precomputed is not None:
+        recommendations_data = {"recommendations": precomputed}
+    else:
+        try:
+            recommendations_data = generate_course_recommendations(student, available_courses)
+        except LLMUnavailable as e:
+            # Nothing is saved: a partial set of groups must not become the student's final recommendations
+            print(f"Recommendations unavailable for student '{student.student_id}': {e}")
+            response = Response(
+                {'error': 'Recommendations are temporarily unavailable. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = str(_retry_after(e))
+            return response
+
+    # Save final recommendations
+    _save_submission(submission, recommendations_data.get('recommendations', []))
+
+    return pin_client_to_primary(Response(recommendations_data, status=status.HTTP_200_OK))
+
+
+# API: Submit student answers and stream each subject group's recommendations as NDJSON
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def submit_answers_stream(request):
+    submission, error = _prepare_submission(request)
+    if error:
+        return error
+    student, available_courses = submission['student'], submission['available_courses']
+
+    def events():
+        final_recommendations = []
+        saved = False
+        try:
+            precomputed = lookup_precomputed(student, available_courses)
+            if precomputed is not None:
+                grouped = {}
+                for rec in precomputed:
+                    grouped.setdefault(rec.get('SubjectGroupName', 'Unknown'), []).append(rec)
+                results = iter(grouped.items())
+            else:
+                results = iter_course_recommendations(student, available_courses)
+
+            for group_name, recommendations in results:
+                final_recommendations.extend(recommendations)
+                yield json.dumps({
+                    "event": "group",
+                    "SubjectGroupName": group_name,
+                    "recommendations": recommendations
+                }) + "\n"
+
+            # Save final recommendations once every group has finished
+            _save_submission(submission, final_recommendations)
+            saved = True
+            yield json.dumps({"event": "done", "recommendations": final_recommendations}) + "\n"
+        except GeneratorExit:
+            # The client went away mid-stream: finish the remaining groups without it so the
+            # submission is still saved (the LLM deadline bounds how long this can take)
+            if not saved:
+                try:
+                    for _, recommendations in results:
+                        final_recommendations.extend(recommendations)
+                    _save_submission(submission, final_recommendations)
+                except Exception as e:
+                    print(f"Could not finish recommendations for disconnected student '{student.student_id}': {e}")
+            raise
+        except LLMUnavailable as e:
+            # The groups sent so far are not saved; the client should resubmit after retry_after seconds
+            print(f"Recommendations unavailable for student '{student.student_id}': {e}")
+            yield json.dumps({
+                "event": "error",
+                "error": "Recommendations are temporarily unavailable. Please try again shortly.",
+                "retry_after": _retry_after(e)
+            }) + "\n"
+        except Exception as e:
+            print(f"An error occurred while streaming recommendations for student '{student.student_id}': {e}")
+            yield json.dumps({"event": "error", "error": "Failed to generate recommendations."}) + "\n"
+
+    response = StreamingHttpResponse(events(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return pin_client_to_primary(response)
 
 
 # API: Get stored student recommendations
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def get_student_recommendation(request, student_id, college_name):
-    student = get_object_or_404(Student, student_id=student_id, college__name=college_name)
+    # Read from the replica unless this student (or this client) just submitted
+    use_replica = PIN_COOKIE not in request.COOKIES and not is_student_pinned(college_name, student_id)
+    with reporting_reads(use_replica):
+        student = get_object_or_404(
+            Student.objects.with_survey_data('recommendations'),
+            student_id=student_id, college__name=college_name
+        )
+    recommendations = student.get_recommendations()
 
-    if not student.recommendations:
+    if not recommendations:
         return Response(
             {'error': 'No recommendations have been generated for this student yet.'},
             status=status.HTTP_404_NOT_FOUND
         )
 
     return Response({
-        "recommendations": student.recommendations
+        "recommendations": recommendations
     })
 
 
 # API: Get all student recommendations for a college
+@reporting_view
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def get_college_recommendations(request, college_name):
     college = get_object_or_404(College, name=college_name)
-    students = Student.objects.filter(college=college, recommendations__isnull=False)
+    students = (
+        Student.objects.with_survey_data('recommendations')
+        .select_related('college')
+        .filter(college=college, recommendations__isnull=False)
+    )
     serializer = StudentRecommendationSerializer(students, many=True)
     return Response({
         "college_name": college_name,
@@ -122,11 +262,95 @@ def get_college_recommendations(request, college_name):
     })
 
 
+# API: Answer distribution per question for a college
+@reporting_view
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_answer_analytics(request, college_name):
+    college = get_object_or_404(College, name=college_name)
+    return Response({
+        "college_name": college_name,
+        "questions": answer_distribution(college)
+    })
+
+
+# API: Most-recommended courses per subject group and semester for a college
+@reporting_view
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_course_analytics(request, college_name):
+    college = get_object_or_404(College, name=college_name)
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response({'error': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "college_name": college_name,
+        "groups": top_recommended_courses(college, request.query_params.get('semester'), limit)
+    })
+
+
+# API: Bulk import (upsert) a college's questions and options from JSON or CSV
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def import_college_survey(request, college_name):
+    college = get_object_or_404(College, name=college_name)
+
+    if request.content_type.startswith('text/csv'):
+        data = request.body.decode('utf-8-sig')
+    elif 'file' in request.FILES:
+        data = request.FILES['file'].read().decode('utf-8-sig')
+    else:
+        data = request.data.get('questions') if isinstance(request.data, dict) else request.data
+
+    if isinstance(data, str):
+        try:
+            data = parse_survey_csv(data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = SurveyQuestionSerializer(data=data, many=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    replace = str(request.query_params.get('replace', '')).lower() in ('1', 'true', 'yes')
+    try:
+        result = import_survey(college, serializer.validated_data, replace=replace)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({"college_name": college_name, **result}, status=status.HTTP_200_OK)
+
+
+# API: Export a college's questions and options as JSON or CSV
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_college_survey(request, college_name):
+    college = get_object_or_404(College, name=college_name)
+    questions = export_survey(college)
+
+    if request.query_params.get('output') == 'csv':
+        response = HttpResponse(survey_to_csv(questions), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{college.college_id}-survey.csv"'
+        return response
+
+    return Response({"college_name": college_name, "questions": questions})
+
+
+# API: LLM rate-limit budgets and queue wait metrics
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_llm_queue_metrics(request):
+    return Response({"buckets": queue_metrics()})
+
+
 # HTML View: College user panel (for web)
 @login_required
+@reporting_view
 def college_user_panel(request):
     if not hasattr(request.user, 'collegeuser'):
         return render(request, 'unauthorized.html')
     
-    students = Student.objects.filter(college=request.user.collegeuser.college)
+    students = Student.objects.with_survey_data().filter(college=request.user.collegeuser.college)
     return render(request, 'college_user_panel.html', {'students': students})
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Gunicorn production serving profile.
+
+Gunicorn loads ./gunicorn.conf.py automatically, so the start command stays
+`gunicorn college_management.wsgi:application`. Every value can be overridden
+from the environment / .env file.
+"""
+import multiprocessing
+
+from decouple import config as env  # 'config' is itself a Gunicorn setting name
+
+bind = f"0.0.0.0:{env('PORT', default='8000')}"
+
+# submit_answers spends most of its time waiting on the college course API and
+# the Gemini API, so a few processes with many threads each serve far more
+# concurrent students than one process per request. Each thread keeps its own
+# persistent DB connection (CONN_MAX_AGE), so workers * threads must stay below
+# the database's connection limit.
+worker_class = 'gthread'
+workers = env('WEB_CONCURRENCY', default=min(multiprocessing.cpu_count() * 2 + 1, 4), cast=int)
+threads = env('GUNICORN_THREADS', default=8, cast=int)
+
+# Import Django and the app once in the master and fork workers from it:
+# faster worker boot and copy-on-write sharing of the loaded modules.
+preload_app = True
+
+# One submission can make several sequential LLM calls. Their total waiting and
+# retrying is capped by LLM_SUBMISSION_TIMEOUT, which must leave room for the
+# college API call and the model calls themselves before the worker is killed.
+timeout = env('GUNICORN_TIMEOUT', default=120, cast=int)
+if env('LLM_SUBMISSION_TIMEOUT', default=90, cast=float) > timeout - 20:
+    raise ValueError(
+        f"LLM_SUBMISSION_TIMEOUT must be at most GUNICORN_TIMEOUT - 20 ({timeout - 20}s) "
+        "so a throttled submission fails with 503 instead of its worker being killed."
+    )
+graceful_timeout = env('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+keepalive = env('GUNICORN_KEEPALIVE', default=5, cast=int)
+
+# Recycle workers periodically to bound memory growth; jitter avoids all
+# workers restarting at once.
+max_requests = env('GUNICORN_MAX_REQUESTS', default=1000, cast=int)
+max_requests_jitter = env('GUNICORN_MAX_REQUESTS_JITTER', default=100, cast=int)
+
+accesslog = '-'
+errorlog = '-'
+loglevel = env('GUNICORN_LOG_LEVEL', default='info')
+
+
+def post_fork(server, worker):
+    # Never share a database connection opened in the master with the forked workers.
+    from django.db import connections
+    connections.close_all()